@@ -0,0 +1,64 @@
+"""
+The ApiClient that is handed to listeners. It shares a rate limiter with all other listener clients,
+and retries requests that the apiserver rejected with 429 (Too Many Requests).
+"""
+from kubernetes import client
+from kubernetes.client.rest import ApiException
+
+from skafos.metrics import METRICS
+from skafos.tracing import TRACER
+
+HTTP_STATUS_TOO_MANY_REQUESTS = 429
+DEFAULT_RETRY_AFTER_SEC = 1
+
+
+def get_retry_after(ex: ApiException) -> float:
+    """
+    :return: float, the Retry-After header of a 429 response in seconds, or a default
+    """
+    try:
+        return float(ex.headers.get('Retry-After'))
+    except (AttributeError, TypeError, ValueError):
+        return DEFAULT_RETRY_AFTER_SEC
+
+
+class ListenerApiClient(client.api_client.ApiClient):
+    """
+    Drop-in replacement for `kubernetes.client.api_client.ApiClient`.
+    """
+
+    def __init__(self, configuration=None, rate_limiter=None, max_retries=3, **kwargs):
+        """
+        :param configuration: (optional) kubernetes.client.Configuration
+        :param skafos.ratelimit.TokenBucket rate_limiter: (optional) shared rate limiter
+        :param int max_retries: (optional) how often a request rejected with 429 is retried
+        """
+        super().__init__(configuration=configuration, **kwargs)
+        self.rate_limiter = rate_limiter
+        self.max_retries = max_retries
+
+    def request(self, method, url, *args, **kwargs):
+        with TRACER.span('api.request', method=method, url=url) as span:
+            if not self.rate_limiter:
+                return super().request(method, url, *args, **kwargs)
+
+            attempt = 0
+            while True:
+                waited = self.rate_limiter.acquire()
+                if waited:
+                    METRICS.inc('skafos_api_throttle_seconds_total', waited)
+                    span.set_attribute('throttled_seconds', waited)
+
+                try:
+                    response = super().request(method, url, *args, **kwargs)
+                except ApiException as ex:
+                    if ex.status != HTTP_STATUS_TOO_MANY_REQUESTS or attempt >= self.max_retries:
+                        raise
+                    METRICS.inc('skafos_api_throttled_responses_total')
+                    self.rate_limiter.throttled(get_retry_after(ex))
+                    attempt += 1
+                    span.set_attribute('retries', attempt)
+                    continue
+
+                self.rate_limiter.succeeded()
+                return response
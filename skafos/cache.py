@@ -0,0 +1,286 @@
+"""
+A read-only, watch-backed cache for Kubernetes objects. Listeners often need related objects
+(Namespaces, Secrets, ConfigMaps) while handling an event. Instead of doing a GET or LIST against
+the apiserver for every event, `CachedClient` serves those reads from an in-memory store that is kept
+up to date by a watch. The watch for a kind (an `Informer`) is only started the first time that kind
+is read.
+
+Writes are not cached: use the regular `api_client` of the listener for those.
+"""
+import logging
+import threading
+import time
+
+from kubernetes import client, watch
+from kubernetes.client.rest import ApiException
+
+HTTP_STATUS_GONE = 410
+
+
+def object_metadata(obj):
+    """
+    Extracts the commonly used metadata fields of a dict or a kubernetes model object.
+
+    :param obj: Kubernetes object, either as dict or as model
+    :return: (name, namespace, resource_version, labels)
+    """
+    if isinstance(obj, dict):
+        metadata = obj.get('metadata') or {}
+        return metadata.get('name'), metadata.get('namespace'), metadata.get('resourceVersion'), \
+            metadata.get('labels') or {}
+
+    metadata = obj.metadata
+    return metadata.name, metadata.namespace, metadata.resource_version, metadata.labels or {}
+
+
+def newer_or_equal(resource_version, min_resource_version) -> bool:
+    """
+    Resource versions are opaque strings according to the API conventions, but in practice they
+    are integers. When both can be parsed they are compared numerically, otherwise only equality counts.
+    """
+    if min_resource_version is None:
+        return True
+    if resource_version is None:
+        return False
+    try:
+        return int(resource_version) >= int(min_resource_version)
+    except ValueError:
+        return str(resource_version) == str(min_resource_version)
+
+
+def match_labels(label_selector: str, labels: dict) -> bool:
+    """
+    Client side evaluation of an equality based label selector, e.g. `app=web,tier!=db,owner`.
+
+    :param str label_selector: selector as accepted by the apiserver
+    :param dict labels: labels of the object
+    :return: whether the labels match the selector
+    """
+    if not label_selector:
+        return True
+
+    for requirement in label_selector.split(','):
+        requirement = requirement.strip()
+        if not requirement:
+            continue
+        if '!=' in requirement:
+            key, value = (x.strip() for x in requirement.split('!=', 1))
+            if labels.get(key) == value:
+                return False
+        elif '=' in requirement:
+            key, value = (x.strip() for x in requirement.replace('==', '=').split('=', 1))
+            if labels.get(key) != value:
+                return False
+        elif requirement.startswith('!'):
+            if requirement[1:].strip() in labels:
+                return False
+        elif requirement not in labels:
+            return False
+    return True
+
+
+class Informer:
+    """
+    Keeps an in-memory copy of all objects returned by a list method, by listing once and then
+    watching for changes. When the watch expires the objects are listed again.
+    """
+
+    def __init__(self, api, method: str, kwargs: dict = None, timeout=300, transform=None):
+        """
+        :param api: instance of a kubernetes api, e.g. `client.CoreV1Api(api_client)`
+        :param str method: name of the list method of `api`, e.g. `list_secret_for_all_namespaces`
+        :param dict kwargs: (optional) keyword arguments for the list method
+        :param int timeout: (optional) timeout of a single watch request in seconds
+        :param transform: (optional) callable applied to every object before it is stored
+        """
+        self.logger = logging.getLogger('skafos')
+
+        self.api = api
+        self.method = method
+        self.kwargs = kwargs or {}
+        self.timeout = timeout
+        self.transform = transform
+
+        self.resource_version = None
+        self.synced = False
+        self.store = {}
+
+        self._condition = threading.Condition()
+        self._watcher = None
+        self._stopped = False
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run, daemon=True, name='informer-' + self.method)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped = True
+        if self._watcher:
+            self._watcher.stop()
+
+    def run(self):
+        needs_list = True
+        while not self._stopped:
+            try:
+                if needs_list:
+                    self.list()
+                    needs_list = False
+                self.watch()
+            except ApiException as ex:
+                needs_list = True  # Our resourceVersion is either expired or unusable
+                if ex.status != HTTP_STATUS_GONE:
+                    self.logger.warning('informer %s failed: %s', self.method, str(ex))
+                    time.sleep(1)
+            except Exception:
+                needs_list = True
+                self.logger.exception('informer %s failed', self.method)
+                time.sleep(1)
+
+    def list(self):
+        result = getattr(self.api, self.method)(**self.kwargs)
+        if isinstance(result, dict):
+            items, resource_version = result.get('items', []), result['metadata'].get('resourceVersion')
+        else:
+            items, resource_version = result.items, result.metadata.resource_version
+
+        store = {}
+        for item in items:
+            if self.transform:
+                item = self.transform(item)
+            name, namespace, _, _ = object_metadata(item)
+            store[(namespace, name)] = item
+
+        with self._condition:
+            self.store = store
+            self.resource_version = resource_version
+            self.synced = True
+            self._condition.notify_all()
+
+    def watch(self):
+        """
+        Applies changes to the store until the watch times out or expires. Bookmarks move the resourceVersion
+        forward when there are no changes to this informer's objects, so `wait_for` doesn't block on versions of
+        other objects.
+        """
+        self._watcher = watch.Watch()
+        stream = self._watcher.stream(getattr(self.api, self.method), **self.kwargs,
+                                      resource_version=self.resource_version, timeout_seconds=self.timeout,
+                                      allow_watch_bookmarks=True)
+        for event in stream:
+            if event['type'] == 'BOOKMARK':
+                resource_version = event['raw_object']['metadata'].get('resourceVersion')
+                with self._condition:
+                    self.resource_version = resource_version
+                    self._condition.notify_all()
+                continue
+
+            obj = event['object']
+            if self.transform:
+                obj = self.transform(obj)
+            name, namespace, resource_version, _ = object_metadata(obj)
+            with self._condition:
+                if event['type'] == 'DELETED':
+                    self.store.pop((namespace, name), None)
+                else:
+                    self.store[(namespace, name)] = obj
+                self.resource_version = resource_version
+                self._condition.notify_all()
+
+    def wait_for(self, min_resource_version=None, timeout=None) -> bool:
+        """
+        Blocks until the informer has synced and has seen at least `min_resource_version`.
+
+        :return: False if this did not happen within `timeout` seconds
+        """
+        with self._condition:
+            return self._condition.wait_for(
+                lambda: self.synced and newer_or_equal(self.resource_version, min_resource_version), timeout)
+
+    def get(self, name, namespace=None):
+        with self._condition:
+            return self.store.get((namespace, name))
+
+    def list_objects(self, namespace=None, label_selector=None) -> list:
+        with self._condition:
+            items = list(self.store.items())
+
+        return [obj for (obj_namespace, _), obj in items
+                if (namespace is None or obj_namespace == namespace)
+                and match_labels(label_selector, object_metadata(obj)[3])]
+
+
+class CachedClient:
+    """
+    Serves `get` and `list` calls from informers. The first read of a kind starts its informer and
+    blocks until the initial list is done. Returned objects are shared with the cache and must be
+    treated as read-only.
+
+    For example:
+        secret = self.cache.get(client.CoreV1Api, 'list_secret_for_all_namespaces', 'my-secret', 'my-ns')
+        namespaces = self.cache.list(client.CoreV1Api, 'list_namespace', label_selector='team=x')
+    """
+
+    def __init__(self, config=None, sync_timeout=30, transform=None):
+        """
+        :param config: (optional) kubernetes.client.Configuration used by the informers
+        :param int sync_timeout: (optional) seconds to wait for an informer to catch up
+        :param transform: (optional) callable applied to every object before it is stored
+        """
+        self.config = config
+        self.sync_timeout = sync_timeout
+        self.transform = transform
+
+        self.informers = {}
+        self.lock = threading.Lock()
+
+    def informer(self, api, method: str, **kwargs) -> Informer:
+        """
+        Returns the informer for a list method, and starts it if it doesn't exist yet.
+
+        :param api: kubernetes api class, e.g. `client.CoreV1Api`
+        :param str method: name of the list method
+        :param kwargs: (optional) keyword arguments for the list method, e.g. `namespace`
+        """
+        key = (api, method, tuple(sorted(kwargs.items())))
+        with self.lock:
+            informer = self.informers.get(key)
+            if informer is None:
+                api_client = client.api_client.ApiClient(configuration=self.config)
+                informer = Informer(api(api_client), method, kwargs, transform=self.transform)
+                informer.start()
+                self.informers[key] = informer
+        return informer
+
+    def get(self, api, method: str, name, namespace=None, min_resource_version=None, **kwargs):
+        """
+        Returns a single object from the cache, or None if it does not exist.
+
+        :param min_resource_version: (optional) wait until the cache has at least seen this resourceVersion
+        :raises TimeoutError: if the cache did not catch up within `sync_timeout` seconds
+        """
+        informer = self.informer(api, method, **kwargs)
+        self.wait_for(informer, min_resource_version)
+        return informer.get(name, namespace)
+
+    def list(self, api, method: str, namespace=None, label_selector=None, min_resource_version=None, **kwargs):
+        """
+        Returns all cached objects, optionally filtered on namespace and (equality based) label selector.
+
+        :param min_resource_version: (optional) wait until the cache has at least seen this resourceVersion
+        :raises TimeoutError: if the cache did not catch up within `sync_timeout` seconds
+        """
+        informer = self.informer(api, method, **kwargs)
+        self.wait_for(informer, min_resource_version)
+        return informer.list_objects(namespace, label_selector)
+
+    def wait_for(self, informer, min_resource_version):
+        if not informer.wait_for(min_resource_version, self.sync_timeout):
+            raise TimeoutError(f'cache for {informer.method} did not reach resourceVersion '
+                               f'{min_resource_version} (at {informer.resource_version})')
+
+    def stop(self):
+        with self.lock:
+            for informer in self.informers.values():
+                informer.stop()
+            self.informers = {}
@@ -0,0 +1,115 @@
+"""
+Per-cluster state of a StreamWatch. Every cluster has its own connection pool, cache and rate limiter;
+all clusters share the worker pool and the listeners. A cluster is watched by one or more event streams
+(e.g. one per namespace), each with its own resourceVersion and reconnects. A stream can only have
+`max_pending` events queued or in progress, which bounds the memory a busy stream uses. Fairness between
+clusters is up to the worker pool, which limits the number of workers per cluster.
+"""
+import threading
+import time
+
+from kubernetes import client
+
+from skafos.api_client import ListenerApiClient
+from skafos.cache import CachedClient
+from skafos.metrics import METRICS
+from skafos.ratelimit import TokenBucket
+
+DEFAULT_CLUSTER = 'default'
+
+
+class Stream:
+    """
+    A single watch of a cluster.
+    """
+
+    def __init__(self, cluster, name: str, kwargs: dict = None, max_pending: int = 1000):
+        """
+        :param Cluster cluster: the cluster that is watched
+        :param str name: name of the stream, e.g. `namespace=default`, used in logs and metric labels
+        :param dict kwargs: (optional) extra keyword arguments for the watch, e.g. `namespace`
+        :param int max_pending: (optional) maximum number of events queued or being handled for this stream
+        """
+        self.cluster = cluster
+        self.name = name
+        self.kwargs = kwargs or {}
+
+        self.max_pending = max_pending
+        self.pending = 0
+        self.condition = threading.Condition()
+
+        self.resource_version = 0
+        self.expired = False  # The resourceVersion expired, the objects have to be listed again
+        self.model = None  # Name of the kubernetes model of the watched objects, None for dicts
+        self.connected = False
+        self.last_error = None
+        self.watcher = None
+        self.thread = None
+
+    def acquire(self):
+        """
+        Blocks while the stream has `max_pending` events queued or in progress.
+        """
+        with self.condition:
+            if self.pending >= self.max_pending:
+                started = time.monotonic()
+                self.condition.wait_for(lambda: self.pending < self.max_pending)
+                METRICS.inc('skafos_stream_backpressure_seconds_total', time.monotonic() - started,
+                            cluster=self.cluster.name, stream=self.name)
+            self.pending += 1
+            METRICS.set('skafos_stream_pending_events', self.pending, cluster=self.cluster.name, stream=self.name)
+
+    def release(self):
+        with self.condition:
+            self.pending -= 1
+            self.condition.notify()
+            METRICS.set('skafos_stream_pending_events', self.pending, cluster=self.cluster.name, stream=self.name)
+
+    def set_connected(self, connected: bool, error: str = None):
+        self.connected = connected
+        self.last_error = error
+        METRICS.set('skafos_stream_up', int(connected), cluster=self.cluster.name, stream=self.name)
+        METRICS.set('skafos_cluster_up', int(self.cluster.connected), cluster=self.cluster.name)
+
+    def status(self) -> str:
+        name = f'{self.cluster.name}/{self.name}'
+        if self.connected:
+            return f'{name}: connected, {self.pending} events pending'
+        return f'{name}: not connected ({self.last_error or "watch not started yet"})'
+
+
+class Cluster:
+    def __init__(self, name: str, config=None, qps: float = None, burst: int = 10):
+        """
+        :param str name: name of the cluster, used in object keys and metric labels
+        :param config: (optional) kubernetes.client.Configuration of the cluster
+        :param float qps: (optional) maximum requests per second of all listeners together, for this cluster
+        :param int burst: (optional) number of requests listeners can make at once, when `qps` is set
+        """
+        self.name = name
+        self.config = config
+        self.api_client = client.api_client.ApiClient(configuration=config)
+        self.cache = CachedClient(config)
+        self.rate_limiter = TokenBucket(qps, burst) if qps else None
+        self.streams = []
+        self.shared_api_client = self.create_api_client()  # For listener instances, which are reused for all events
+
+    def create_api_client(self):
+        """
+        :return: ListenerApiClient, a new ApiClient for a listener that shares the rate limiter of the cluster
+        """
+        return ListenerApiClient(configuration=self.config, rate_limiter=self.rate_limiter)
+
+    @property
+    def connected(self) -> bool:
+        """
+        :return: whether all streams of this cluster are connected
+        """
+        return bool(self.streams) and all(stream.connected for stream in self.streams)
+
+    @property
+    def pending(self) -> int:
+        return sum(stream.pending for stream in self.streams)
+
+    def status(self) -> str:
+        return '\n'.join(stream.status() for stream in self.streams)
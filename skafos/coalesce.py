@@ -0,0 +1,139 @@
+"""
+Coalescing of patches to the same object. Listeners frequently patch the status of an object
+several times within a short period; only the merged result of those patches has to reach the apiserver.
+"""
+import logging
+import threading
+import time
+from concurrent.futures import Future
+
+from skafos.metrics import METRICS
+
+
+def is_json_patch(body) -> bool:
+    return isinstance(body, list) and all(isinstance(x, dict) and 'op' in x for x in body)
+
+
+def mergeable(func, first, second) -> bool:
+    """
+    Whether two patches for `func` can be merged by `merge_patches`. Two json-patch lists can always be merged.
+    Dicts only when they are sent as JSON merge patch, which is the case for custom objects. The kubernetes
+    client sends other dict patches as strategic merge patch, which merges lists by key (e.g. conditions by
+    type) and supports `$patch` directives, so merging those client side would lose changes.
+    """
+    if is_json_patch(first) and is_json_patch(second):
+        return True
+    return isinstance(first, dict) and isinstance(second, dict) and 'custom_object' in func.__name__
+
+
+def merge_patches(first, second):
+    """
+    Combines two patches into one that has the same effect as applying them in order. Dicts are merged
+    recursively as JSON merge patches (a None value still deletes the field), lists of json-patch operations
+    are concatenated and any other value is replaced by the second patch. See `mergeable`.
+    """
+    if isinstance(first, dict) and isinstance(second, dict):
+        merged = dict(first)
+        for key, value in second.items():
+            merged[key] = merge_patches(first[key], value) if key in first else value
+        return merged
+    if is_json_patch(first) and is_json_patch(second):
+        return first + second
+    return second
+
+
+def api_host(func):
+    """
+    :return: host of the apiserver a (bound) api method calls, None if unknown
+    """
+    api_client = getattr(getattr(func, '__self__', None), 'api_client', None)
+    return getattr(getattr(api_client, 'configuration', None), 'host', None)
+
+
+class WriteCoalescer:
+    """
+    Delays patch calls for `delay` seconds. Patches that are submitted for the same method and
+    object in the meantime are merged, and only the merged patch is sent. A patch that can't be merged
+    with the pending one (see `mergeable`) first sends the pending patch, so they are applied in order.
+
+    For example:
+        future = self.coalescer.submit(api.patch_namespaced_custom_object_status,
+                                       group, version, namespace, plural, name, body={'status': status})
+    """
+
+    def __init__(self, delay: float = 0.3):
+        """
+        :param float delay: (optional) seconds a patch waits for other patches to the same object
+        """
+        self.logger = logging.getLogger('skafos')
+        self.delay = delay
+
+        self.pending = {}
+        self.condition = threading.Condition()
+        threading.Thread(target=self.run, daemon=True, name='write-coalescer').start()
+
+    def submit(self, func, *args, body, **kwargs) -> Future:
+        """
+        Schedules `func(*args, body=body, **kwargs)`. Calls with the same method name and arguments, to the
+        same apiserver, are considered to target the same object.
+
+        :return: Future that resolves to the result of the (merged) call
+        """
+        key = (api_host(func), func.__name__, args, tuple(sorted(kwargs.items())))
+        while True:
+            with self.condition:
+                pending = self.pending.get(key)
+                if pending is None:
+                    pending = {
+                        'deadline': time.monotonic() + self.delay,
+                        'func': func,
+                        'args': args,
+                        'kwargs': kwargs,
+                        'body': body,
+                        'future': Future()
+                    }
+                    self.pending[key] = pending
+                    self.condition.notify()
+                    return pending['future']
+
+                if mergeable(func, pending['body'], body):
+                    METRICS.inc('skafos_coalesced_writes_total')
+                    pending['func'] = func
+                    pending['body'] = merge_patches(pending['body'], body)
+                    return pending['future']
+                del self.pending[key]
+
+            self.send(pending)  # Can't be merged, the pending patch has to be applied first
+
+    def flush(self, force=False):
+        """
+        Sends all patches whose delay has passed, or all patches when `force` is set.
+        """
+        now = time.monotonic()
+        with self.condition:
+            due = [key for key, pending in self.pending.items() if force or pending['deadline'] <= now]
+            ready = [self.pending.pop(key) for key in due]
+
+        for pending in ready:
+            self.send(pending)
+
+    def send(self, pending):
+        if not pending['future'].set_running_or_notify_cancel():
+            return
+        try:
+            result = pending['func'](*pending['args'], body=pending['body'], **pending['kwargs'])
+            pending['future'].set_result(result)
+        except Exception as ex:
+            self.logger.warning('coalesced %s failed: %s', pending['func'].__name__, str(ex))
+            pending['future'].set_exception(ex)
+
+    def run(self):
+        while True:
+            with self.condition:
+                if self.pending:
+                    timeout = min(x['deadline'] for x in self.pending.values()) - time.monotonic()
+                else:
+                    timeout = None
+                if timeout is None or timeout > 0:
+                    self.condition.wait(timeout)
+            self.flush()
@@ -0,0 +1,214 @@
+"""
+Memory efficient representation of watch events. A watch event normally holds an object twice: as dict
+(`raw_object`) and as deserialized model (`object`). `CompactEvent` only keeps the (optionally transformed)
+dict, with repeated strings interned, and deserializes the model when it is accessed.
+"""
+import json
+import sys
+from types import SimpleNamespace
+
+from kubernetes import client
+
+LAST_APPLIED_ANNOTATION = 'kubectl.kubernetes.io/last-applied-configuration'
+ALWAYS_PROJECTED = ('apiVersion', 'kind', 'metadata.name', 'metadata.namespace', 'metadata.resourceVersion')
+
+_api_client = None
+
+
+def strip_object(obj):
+    """
+    Removes `managedFields` and the last-applied-configuration annotation from an object. Works on dicts
+    and on kubernetes models, the object is modified in place.
+
+    :param obj: Kubernetes object
+    :return: the same object
+    """
+    if isinstance(obj, dict):
+        metadata = obj.get('metadata') or {}
+        metadata.pop('managedFields', None)
+        annotations = metadata.get('annotations')
+    else:
+        metadata = obj.metadata
+        metadata.managed_fields = None
+        annotations = metadata.annotations
+
+    if annotations:
+        annotations.pop(LAST_APPLIED_ANNOTATION, None)
+    return obj
+
+
+def projection(*paths):
+    """
+    Creates a transform that only keeps the given fields of a dict object, e.g.
+    `projection('metadata.labels', 'spec.image')`. The name, namespace and resourceVersion are always kept.
+    A projected object lacks fields that kubernetes models require, so events of model targets (e.g. Pods)
+    keep it as dict: `event['object']` is the projected dict.
+
+    :param str paths: dotted paths of the fields to keep
+    :return: callable that transforms a dict object
+    """
+    split_paths = [path.split('.') for path in ALWAYS_PROJECTED + paths]
+
+    def transform(obj: dict) -> dict:
+        projected = {}
+        for path in split_paths:
+            source, target = obj, projected
+            for key in path[:-1]:
+                source = source.get(key) if isinstance(source, dict) else None
+                if not isinstance(source, dict):
+                    break
+                target = target.setdefault(key, {})
+            else:
+                if path[-1] in source:
+                    target[path[-1]] = source[path[-1]]
+        return projected
+
+    transform.partial = True  # Not a valid model anymore, see `CompactEvent.from_event`
+    return transform
+
+
+def intern_strings(obj: dict) -> dict:
+    """
+    Interns strings that are repeated across many objects: kind, apiVersion, namespace and the keys
+    (and label values) of labels and annotations. The object is modified in place.
+    """
+    for key in ('apiVersion', 'kind'):
+        if isinstance(obj.get(key), str):
+            obj[key] = sys.intern(obj[key])
+
+    metadata = obj.get('metadata')
+    if not isinstance(metadata, dict):
+        return obj
+
+    if isinstance(metadata.get('namespace'), str):
+        metadata['namespace'] = sys.intern(metadata['namespace'])
+    if metadata.get('labels'):
+        metadata['labels'] = {sys.intern(k): sys.intern(v) if isinstance(v, str) else v
+                              for k, v in metadata['labels'].items()}
+    if metadata.get('annotations'):
+        metadata['annotations'] = {sys.intern(k): v for k, v in metadata['annotations'].items()}
+    return obj
+
+
+def deserialize(raw_object: dict, model: str):
+    """
+    Deserializes a dict into a kubernetes model in the same way `kubernetes.watch.Watch` does.
+    """
+    global _api_client
+    if _api_client is None:
+        _api_client = client.api_client.ApiClient()
+    return _api_client.deserialize(SimpleNamespace(data=json.dumps(raw_object)), model)
+
+
+def deep_sizeof(obj, seen=None) -> int:
+    """
+    Approximates the number of bytes an object and everything it references occupies. Objects that are
+    referenced multiple times (e.g. interned strings) are only counted once.
+
+    :return: int, size in bytes
+    """
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_sizeof(k, seen) + deep_sizeof(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_sizeof(x, seen) for x in obj)
+    elif hasattr(obj, '__dict__'):
+        size += deep_sizeof(vars(obj), seen)
+    if hasattr(type(obj), '__slots__'):
+        size += sum(deep_sizeof(getattr(obj, slot), seen) for slot in type(obj).__slots__ if hasattr(obj, slot))
+    return size
+
+
+class CompactEvent:
+    """
+    Replacement for the event dicts produced by `kubernetes.watch.Watch`. It supports the same
+    `event['type']`, `event['object']` and `event['raw_object']` lookups.
+    """
+    __slots__ = ('type', 'raw_object', 'name', 'namespace', 'resource_version', 'model', '_object', 'trace',
+                 'cluster', 'resync')
+
+    def __init__(self, ev_type: str, raw_object: dict, model: str = None, cluster: str = None):
+        """
+        :param str ev_type: type of the event, e.g. ADDED
+        :param dict raw_object: the object as dict
+        :param str model: (optional) name of the kubernetes model for `object`, e.g. V1Pod
+        :param str cluster: (optional) name of the cluster the event was received from
+        """
+        self.type = sys.intern(ev_type)
+        self.raw_object = raw_object
+        self.model = model
+        self._object = None
+        self.trace = None  # (trace_id, span_id, enqueued_ns) when tracing is enabled
+        self.cluster = cluster
+        self.resync = False  # True for events emitted by a periodic resync
+
+        metadata = raw_object.get('metadata') or {}
+        self.name = metadata.get('name')
+        self.namespace = metadata.get('namespace')
+        self.resource_version = metadata.get('resourceVersion')
+
+    @classmethod
+    def from_event(cls, event: dict, transform=None, model: str = None):
+        """
+        Converts an event produced by `kubernetes.watch.Watch` into a `CompactEvent`.
+
+        :param dict event: watch event
+        :param str model: (optional) name of the kubernetes model of the object, when the watch did not
+                          deserialize it (see `StreamWatch.watch_request`)
+        :param transform: (optional) callable applied to the `raw_object` dict, e.g. `strip_object`. The object of
+                          a transform with a `partial` attribute (e.g. a `projection`) is not deserialized
+        """
+        if isinstance(event, CompactEvent):
+            return event
+
+        raw_object = event.get('raw_object', event['object'])
+        if transform:
+            raw_object = transform(raw_object)
+
+        obj = event['object']
+        if model is None and not isinstance(obj, dict):
+            model = type(obj).__name__
+        if getattr(transform, 'partial', False):
+            model = None
+        return cls(event['type'], intern_strings(raw_object), model)
+
+    @property
+    def object(self):
+        if self.model is None:
+            return self.raw_object
+        if self._object is None:
+            self._object = deserialize(self.raw_object, self.model)
+        return self._object
+
+    def __getitem__(self, key):
+        if key == 'type':
+            return self.type
+        if key == 'object':
+            return self.object
+        if key == 'raw_object':
+            return self.raw_object
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __contains__(self, key):
+        return key in ('type', 'object', 'raw_object')
+
+    def __getstate__(self):
+        return self.type, self.raw_object, self.model, self.cluster, self.resync
+
+    def __setstate__(self, state):
+        self.__init__(*state[:4])
+        self.resync = state[4]
+
+    def __repr__(self):
+        return f'CompactEvent({self.type}, {self.namespace}/{self.name}, rv={self.resource_version})'
@@ -6,12 +6,26 @@ import logging
 import traceback
 from typing import Union
 
+from skafos.resync import object_digest
+from skafos.tracing import TRACER
+
+LISTENER_METHODS = {
+    'ADDED': 'create',
+    'MODIFIED': 'update',
+    'DELETED': 'delete',
+    'ERROR': 'error'
+}
+
 
 class EventListener:
     """
     This class is responsible for partially unwrapping events and creating
     references to some shared frequently-used objects (e.g. dyn_client, gauge).
+
+    Set `run_in_process` to True on a (CPU heavy) listener class to execute it in a worker process, when
+    the StreamWatch runs with `n_processes`. Such a listener and its `ev_state` must be picklable.
     """
+    run_in_process = False
 
     def __init__(self, api_client, event=None):
         """
@@ -25,6 +39,9 @@ class EventListener:
         self.ev_state = None
 
         self.api_client = api_client
+        self.cluster = None  # Name of the cluster the event was received from, set by the StreamWatch
+        self.cache = None  # skafos.cache.CachedClient for reads, set by the StreamWatch
+        self.coalescer = None  # skafos.coalesce.WriteCoalescer, set by the StreamWatch when enabled
         self.event = None
         self.event_obj = None
         self.metadata = None
@@ -60,17 +77,20 @@ class EventListener:
 
         process_ok = True
         try:
-            if self.event['type'] == 'ADDED':
-                process_ok = self.create()
-            elif self.event['type'] == 'MODIFIED':
-                process_ok = self.update()
-            elif self.event['type'] == 'DELETED':
-                process_ok = self.delete()
-            elif self.event['type'] == 'ERROR':
-                process_ok = self.error()
-            else:
-                self.logger.warning("nothing to do event:")
-                self.logger.warning(str(self.event))
+            with TRACER.span('listener.' + LISTENER_METHODS.get(self.event['type'], 'none'),
+                             listener=self.get_name()) as span:
+                if self.event['type'] == 'ADDED':
+                    process_ok = self.create()
+                elif self.event['type'] == 'MODIFIED':
+                    process_ok = self.update()
+                elif self.event['type'] == 'DELETED':
+                    process_ok = self.delete()
+                elif self.event['type'] == 'ERROR':
+                    process_ok = self.error()
+                else:
+                    self.logger.warning("nothing to do event:")
+                    self.logger.warning(str(self.event))
+                span.set_attribute('ok', process_ok is not False)
 
             # Compatibility with older versions, empty return will be seen as ok
             if process_ok is None:
@@ -126,6 +146,24 @@ class EventListener:
         rolled back first, then the second recent, etc.
         """
 
+    def digest(self) -> str:
+        """
+        Digest of the current object, stored after a successful reconcile. Override this to only include
+        the fields this listener depends on.
+
+        :return: str, defaults to a digest of the object without its status
+        """
+        return object_digest(self.event['raw_object'])
+
+    def needs_resync(self, last_digest) -> bool:
+        """
+        Called on a periodic resync, before `update`. Override this to e.g. always check external state.
+
+        :param last_digest: digest of the last successful reconcile, None if unknown
+        :return: whether the listener should run, defaults to whether the object changed
+        """
+        return last_digest != self.digest()
+
     def get_name(self) -> str:
         """
         :return: str, name of module, defaults to ClassName
@@ -1,19 +1,83 @@
-import http
+import math
+import threading
 import time
 from datetime import datetime
 from http import HTTPStatus
-from http.server import BaseHTTPRequestHandler
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from threading import Thread
+from urllib.parse import parse_qs
 
-last_beat = time.time()
-minimal_beat_time = 3600
+from skafos import profiler
+from skafos.metrics import METRICS
 
+MAX_PROFILE_SECONDS = 300
+MIN_PROFILE_INTERVAL = 0.001
 
-def start_healthcheck(minimal_heartbeat_time: int, port: int = 5000):
-    global minimal_beat_time
-    minimal_beat_time = minimal_heartbeat_time
 
-    httpd = http.server.HTTPServer(('', port), HealthCheck, False)
+class HealthState:
+    """
+    Liveness is based on heartbeats of the event stream, plus any registered liveness checks.
+    Readiness is set once the event stream is running, plus any registered readiness checks. Checks are
+    callables that return a tuple (bool ok, str message).
+    """
+
+    def __init__(self, minimal_beat_time=3600):
+        self.last_beat = time.time()
+        self.minimal_beat_time = minimal_beat_time
+        self.ready = False
+        self.liveness_checks = []
+        self.readiness_checks = []
+        self.lock = threading.Lock()
+
+    def beat(self):
+        self.last_beat = time.time()
+
+    def live(self):
+        """
+        :return: (bool, str), whether the process is alive and a message explaining why (not)
+        """
+        current_time = time.time()
+        last_beat = self.last_beat
+        if last_beat + self.minimal_beat_time < current_time:
+            return False, f'Last beat was at {datetime.fromtimestamp(last_beat)}, ' \
+                          f'current time {datetime.fromtimestamp(current_time)} ' \
+                          f'and minimal heartbeat time is {self.minimal_beat_time}'
+        return self.run_checks(self.liveness_checks)
+
+    def is_ready(self):
+        """
+        :return: (bool, str), whether the process is ready and a message explaining why (not)
+        """
+        if not self.ready:
+            return False, 'Event stream is not running'
+        return self.run_checks(self.readiness_checks)
+
+    def run_checks(self, checks):
+        with self.lock:
+            checks = list(checks)
+        for check in checks:
+            check_ok, message = check()
+            if not check_ok:
+                return False, message
+        return True, 'Ok'
+
+
+state = HealthState()
+
+
+def start_healthcheck(minimal_heartbeat_time: int, port: int = 5000, profiling: bool = False):
+    """
+    :param int minimal_heartbeat_time: seconds after the last beat at which the process is considered dead
+    :param int port: (optional) port to serve the health checks and metrics on
+    :param bool profiling: (optional) whether to serve `/debug/profile`, which anyone that can reach the port
+                           can use to sample the process for minutes
+    """
+    state.minimal_beat_time = minimal_heartbeat_time
+
+    httpd = ThreadingHTTPServer(('', port), HealthCheck, False)
+    httpd.daemon_threads = True
+    httpd.health = state
+    httpd.profiling = profiling
     httpd.server_bind()
     httpd.server_activate()
 
@@ -23,26 +87,70 @@ def start_healthcheck(minimal_heartbeat_time: int, port: int = 5000):
 
     thread = Thread(target=serve_forever, args=(httpd,), daemon=True)
     thread.start()
+    return httpd
 
 
 def beat_healthcheck():
-    global last_beat
-    last_beat = time.time()
+    state.beat()
+
+
+def set_ready(ready: bool = True):
+    state.ready = ready
+
+
+def add_liveness_check(check):
+    with state.lock:
+        state.liveness_checks.append(check)
+
+
+def add_readiness_check(check):
+    with state.lock:
+        state.readiness_checks.append(check)
 
 
 class HealthCheck(BaseHTTPRequestHandler):
     def do_GET(self):
-        global last_beat
-        global minimal_beat_time
+        path, _, query = self.path.partition('?')
+        health = getattr(self.server, 'health', state)
 
-        current_time = time.time()
-        if last_beat + minimal_beat_time < current_time:
-            msg = f'Last beat was at {datetime.fromtimestamp(last_beat)}, ' \
-                  f'current time {datetime.fromtimestamp(current_time)} ' \
-                  f'and minimal heartbeat time is {minimal_beat_time}'
-            self.reply(code=HTTPStatus.INTERNAL_SERVER_ERROR, message=msg)
+        if path == '/metrics':
+            self.reply(message=METRICS.render())
+            return
+        if path == '/debug/profile':
+            if getattr(self.server, 'profiling', False):
+                self.profile(parse_qs(query))
+            else:
+                self.reply(code=HTTPStatus.NOT_FOUND, message='Profiling is not enabled')
+            return
+        if path == '/readyz':
+            check_ok, message = health.is_ready()
+        else:  # /livez, and any other path for backwards compatibility
+            check_ok, message = health.live()
+
+        self.reply(code=HTTPStatus.OK if check_ok else HTTPStatus.INTERNAL_SERVER_ERROR, message=message)
+
+    def profile(self, params: dict):
+        """
+        Samples the stacks of all threads for `seconds` (default 10) seconds, every `interval` (default 0.01)
+        seconds, and replies with the folded stacks.
+        """
+        try:
+            seconds = float(params.get('seconds', ['10'])[0])
+            interval = float(params.get('interval', ['0.01'])[0])
+        except ValueError:
+            seconds = interval = math.nan
+        if not (math.isfinite(seconds) and math.isfinite(interval)) or seconds <= 0 or interval <= 0:
+            self.reply(code=HTTPStatus.BAD_REQUEST, message='seconds and interval must be positive numbers')
+            return
+
+        # A very short interval would keep the GIL busy and stall the operator
+        seconds, interval = min(seconds, MAX_PROFILE_SECONDS), max(interval, MIN_PROFILE_INTERVAL)
+
+        stacks = profiler.profile(seconds, interval)
+        if stacks is None:
+            self.reply(code=HTTPStatus.CONFLICT, message='Another profile is running')
         else:
-            self.reply(message='Ok')
+            self.reply(message=stacks)
 
     def reply(self, code=HTTPStatus.OK, message: str = None):
         self.send_response(code)
@@ -0,0 +1,51 @@
+"""
+A minimal in-process metrics registry. Values are exposed in the Prometheus text format on the
+`/metrics` path of the health check server.
+"""
+import threading
+
+
+class Metrics:
+    """
+    Thread safe counters and gauges, identified by name and an optional set of labels.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.values = {}
+
+    @staticmethod
+    def key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def inc(self, name: str, value=1, **labels):
+        key = self.key(name, labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + value
+
+    def set(self, name: str, value, **labels):
+        with self.lock:
+            self.values[self.key(name, labels)] = value
+
+    def get(self, name: str, **labels):
+        with self.lock:
+            return self.values.get(self.key(name, labels), 0)
+
+    def render(self) -> str:
+        """
+        :return: str, all metrics in the Prometheus text exposition format
+        """
+        with self.lock:
+            values = sorted(self.values.items())
+
+        lines = []
+        for (name, labels), value in values:
+            if labels:
+                label_str = ','.join(f'{k}="{v}"' for k, v in labels)
+                lines.append(f'{name}{{{label_str}}} {value}')
+            else:
+                lines.append(f'{name} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+METRICS = Metrics()
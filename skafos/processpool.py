@@ -0,0 +1,235 @@
+"""
+Runs CPU heavy listeners in worker processes, so they are not limited to a single core by the GIL.
+Listeners opt in by setting `run_in_process = True` on their class. Every object key is assigned to a
+fixed process, so events for the same object are still handled in order.
+
+Events are sent to the processes as pickled `CompactEvent`s. The listener is created in the process with
+its own ApiClient, and lives there until the reconcile is finished so a rollback can be executed by the
+same instance.
+"""
+import itertools
+import logging
+import multiprocessing
+import threading
+import zlib
+
+from kubernetes import client
+
+from skafos.api_client import ListenerApiClient
+from skafos.compact import CompactEvent
+from skafos.metrics import METRICS
+
+
+def child_main(conn, config, clusters):
+    """
+    Main loop of a worker process. Handles `process`, `needs_resync`, `digest`, `rollback` and `release`
+    messages from the parent.
+    """
+    logger = logging.getLogger('skafos')
+    instances = {}  # token -> listener instance
+
+    def create_listener(token, listener_cls, event):
+        listener = listener_cls(ListenerApiClient(configuration=clusters.get(event.cluster, config)), event)
+        listener.cluster = event.cluster
+        instances[token] = listener
+        return listener
+
+    while True:
+        try:
+            command, token, payload = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            return
+
+        if command == 'process':
+            listener_cls, event, ev_state = payload
+            process_ok = False
+            try:
+                process_ok = create_listener(token, listener_cls, event).process(event, ev_state)
+            except Exception:
+                logger.exception('listener failed to process event')
+            conn.send((process_ok, ev_state))
+
+        elif command == 'needs_resync':
+            listener_cls, event, ev_state, last_digest = payload
+            needs_resync = True
+            try:
+                listener = create_listener(token, listener_cls, event)
+                listener.process_event(event, ev_state)
+                needs_resync = listener.needs_resync(last_digest)
+            except Exception:
+                logger.exception('listener failed to check for resync')
+            conn.send(needs_resync)
+
+        elif command == 'digest':
+            digest = None
+            try:
+                if token in instances:
+                    digest = instances[token].digest()
+            except Exception:
+                logger.exception('listener failed to compute digest')
+            conn.send(digest)
+
+        elif command == 'rollback':
+            listener = instances.get(token)
+            if listener is None:
+                logger.error('cannot rollback, listener %d is unknown to this worker process', token)
+                conn.send(False)
+                continue
+            try:
+                listener.rollback()
+            except Exception:
+                logger.exception('listener failed to rollback')
+            conn.send(True)
+
+        elif command == 'release':  # No reply, the parent doesn't wait for this
+            instances.pop(token, None)
+
+
+class Child:
+    def __init__(self, context, config, clusters):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=child_main, args=(child_conn, config, clusters), daemon=True)
+        self.process.start()
+        child_conn.close()  # Only the child holds this end, so recv raises EOFError when the child dies
+
+    def stop(self):
+        self.conn.close()
+        self.process.terminate()
+
+
+class ProcessPool:
+    """
+    A fixed number of worker processes. A process that crashes is restarted, and the call that was in
+    flight is retried once on the new process. The listeners that lived in the crashed process are lost,
+    so their rollbacks are lost too; `lost` holds their tokens until they are released.
+    """
+
+    def __init__(self, processes: int, config=None, clusters: dict = None):
+        """
+        :param int processes: number of worker processes
+        :param config: (optional) kubernetes.client.Configuration for the ApiClients in the processes
+        :param dict clusters: (optional) cluster name -> client.Configuration, for events of other clusters
+        """
+        self.logger = logging.getLogger('skafos')
+
+        # Processes are spawned, forking a process that runs threads is not safe
+        self.context = multiprocessing.get_context('spawn')
+        self.config = config or client.Configuration.get_default_copy()
+        self.clusters = clusters or {}
+        self.children = [None] * processes
+        self.locks = [threading.Lock() for _ in range(processes)]
+        self.held = [set() for _ in range(processes)]  # tokens of the listeners that live in each process
+        self.lost = set()
+        self.tokens = itertools.count()
+
+    def index(self, key) -> int:
+        """
+        :return: int, index of the process that handles `key`
+        """
+        return zlib.crc32(repr(key).encode('utf-8')) % len(self.children)
+
+    def child(self, index, restart=False) -> Child:
+        if restart and self.children[index]:
+            self.children[index].stop()
+            self.children[index] = None
+            METRICS.inc('skafos_process_restarts_total')
+            if self.held[index]:
+                self.logger.error('worker process %d held %d listeners, their rollbacks are lost',
+                                  index, len(self.held[index]))
+                self.lost.update(self.held[index])
+                self.held[index] = set()
+        if self.children[index] is None:
+            self.children[index] = Child(self.context, self.config, self.clusters)
+        return self.children[index]
+
+    def call(self, key, command, token, payload=None):
+        """
+        Sends a message to the process of `key` and waits for the reply.
+        """
+        index = self.index(key)
+        with self.locks[index]:
+            for attempt in range(2):
+                child = self.child(index, restart=attempt > 0)
+                try:
+                    child.conn.send((command, token, payload))
+                    reply = child.conn.recv()
+                    if command in ('process', 'needs_resync'):  # These create a listener in the process
+                        self.held[index].add(token)
+                    return reply
+                except (EOFError, OSError):
+                    self.logger.warning('worker process %d died during %s of %s, restarting', index, command, key)
+            raise RuntimeError(f'worker process {index} died twice during {command} of {key}')
+
+    def send(self, key, command, token, payload=None):
+        """
+        Sends a message to the process of `key` without waiting for a reply.
+        """
+        index = self.index(key)
+        with self.locks[index]:
+            if command == 'release':
+                self.held[index].discard(token)
+                self.lost.discard(token)
+            child = self.children[index]
+            try:
+                if child:
+                    child.conn.send((command, token, payload))
+            except OSError:
+                pass  # The process is gone, and with it the state we wanted to release
+
+    def stop(self):
+        for index, child in enumerate(self.children):
+            if child:
+                child.stop()
+                self.children[index] = None
+
+
+class RemoteListener:
+    """
+    Stands in for a listener that runs in a worker process, in the listener chain of `StreamWatch.reconcile`.
+    """
+
+    def __init__(self, pool: ProcessPool, listener_cls, event):
+        self.pool = pool
+        self.listener_cls = listener_cls
+        self.token = next(pool.tokens)
+
+        event = CompactEvent.from_event(event)
+        self.key = (event.cluster, event.namespace, event.name)
+        self.event = event
+        self.ev_state = {}
+
+    def process(self, event, ev_state) -> bool:
+        payload = (self.listener_cls, CompactEvent.from_event(event), ev_state)
+        process_ok, new_ev_state = self.pool.call(self.key, 'process', self.token, payload)
+        ev_state.update(new_ev_state)
+        return process_ok
+
+    def rollback(self) -> bool:
+        """
+        Rolls back the listener in its worker process.
+
+        :return: bool, False when the rollback was lost because the worker process was restarted
+        """
+        if self.token in self.pool.lost or not self.pool.call(self.key, 'rollback', self.token):
+            self.pool.logger.error('rollback of %s for %s is lost, its worker process was restarted',
+                                   self.get_name(), str(self.key))
+            METRICS.inc('skafos_lost_rollbacks_total', listener=self.get_name())
+            return False
+        return True
+
+    def release(self):
+        self.pool.send(self.key, 'release', self.token)
+
+    def digest(self) -> str:
+        return self.pool.call(self.key, 'digest', self.token)
+
+    def needs_resync(self, last_digest) -> bool:
+        payload = (self.listener_cls, self.event, self.ev_state, last_digest)
+        return self.pool.call(self.key, 'needs_resync', self.token, payload)
+
+    def process_event(self, event, ev_state):
+        self.event = CompactEvent.from_event(event)
+        self.ev_state = ev_state
+
+    def get_name(self) -> str:
+        return self.listener_cls.__name__
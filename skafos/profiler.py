@@ -0,0 +1,63 @@
+"""
+Sampling profiler for all threads in the process. The result is in the "folded stacks" format, which
+can be turned into a flamegraph by e.g. flamegraph.pl or speedscope.
+"""
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+profile_lock = threading.Lock()
+
+
+def frame_name(frame) -> str:
+    code = frame.f_code
+    return f'{os.path.basename(code.co_filename)}:{code.co_name}'
+
+
+def sample(seconds: float, interval: float = 0.01) -> Counter:
+    """
+    Samples the stacks of all other threads every `interval` seconds, for `seconds` seconds.
+
+    :return: Counter of folded stacks (thread;outer;...;inner) and the number of times they were seen
+    """
+    own_thread = threading.get_ident()
+    stacks = Counter()
+    deadline = time.monotonic() + seconds
+
+    while time.monotonic() < deadline:
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == own_thread:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(frame_name(frame))
+                frame = frame.f_back
+            stack.append(names.get(ident, str(ident)))
+            stacks[';'.join(reversed(stack))] += 1
+        time.sleep(interval)
+
+    return stacks
+
+
+def render(stacks: Counter) -> str:
+    """
+    :return: str, one `stack count` line per stack
+    """
+    return ''.join(f'{stack} {count}\n' for stack, count in stacks.most_common())
+
+
+def profile(seconds: float, interval: float = 0.01):
+    """
+    Profiles the process, only one profile can run at a time.
+
+    :return: str folded stacks, or None if another profile is running
+    """
+    if not profile_lock.acquire(blocking=False):
+        return None
+    try:
+        return render(sample(seconds, interval))
+    finally:
+        profile_lock.release()
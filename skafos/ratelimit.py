@@ -0,0 +1,74 @@
+"""
+Client side rate limiting for calls to the apiserver. All listeners share a single `TokenBucket`,
+so the operator as a whole stays below the configured QPS. When the apiserver answers with a 429
+the bucket backs off for the Retry-After period and lowers its rate, which then slowly recovers.
+"""
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    Token bucket with a sustained rate of `qps` and bursts of up to `burst` requests.
+    """
+
+    def __init__(self, qps: float, burst: int = 10, min_qps: float = None, recovery: float = 0.05):
+        """
+        :param float qps: sustained number of requests per second
+        :param int burst: (optional) number of requests that can be made at once
+        :param float min_qps: (optional) lower bound for the rate after 429 responses, defaults to qps / 10
+        :param float recovery: (optional) fraction of qps that is recovered per successful request
+        """
+        self.max_qps = qps
+        self.qps = qps
+        self.min_qps = min_qps or qps / 10
+        self.burst = burst
+        self.recovery = recovery
+
+        self.tokens = float(burst)
+        self.last = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """
+        Takes a token, possibly going into debt.
+
+        :return: float, seconds the caller has to wait before it may use the token
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.last) * self.qps)
+            self.last = now
+            self.tokens -= 1
+
+            wait = -self.tokens / self.qps if self.tokens < 0 else 0.0
+            return max(wait, self.blocked_until - now)
+
+    def acquire(self) -> float:
+        """
+        Blocks until a request may be made.
+
+        :return: float, seconds spent waiting
+        """
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def throttled(self, retry_after: float):
+        """
+        Called when the apiserver rejected a request with 429. Blocks all requests for `retry_after`
+        seconds and halves the rate.
+        """
+        with self.lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + retry_after)
+            self.qps = max(self.min_qps, self.qps / 2)
+
+    def succeeded(self):
+        """
+        Called after a successful request, slowly recovers the rate after throttling.
+        """
+        if self.qps < self.max_qps:
+            with self.lock:
+                self.qps = min(self.max_qps, self.qps + self.max_qps * self.recovery)
@@ -0,0 +1,129 @@
+"""
+Periodic, level-triggered resync of all watched objects. Instead of replaying every object at once,
+every object is resynced once per `period` at a fixed offset within that period, so resyncs are spread
+evenly. Listeners compare a digest of the object with the digest of their last successful reconcile,
+and only do work when the object drifted.
+"""
+import hashlib
+import json
+import logging
+import threading
+import time
+import zlib
+
+from skafos.metrics import METRICS
+from skafos.ratelimit import TokenBucket
+
+
+def object_digest(raw_object: dict) -> str:
+    """
+    Digest of an object, ignoring its status and fields that change without a change of the object itself
+    (resourceVersion, managedFields).
+
+    :return: str, hex digest
+    """
+    metadata = {k: v for k, v in (raw_object.get('metadata') or {}).items()
+                if k not in ('resourceVersion', 'managedFields')}
+    stable = {k: v for k, v in raw_object.items() if k not in ('metadata', 'status')}
+    stable['metadata'] = metadata
+    return hashlib.sha1(json.dumps(stable, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+class DigestStore:
+    """
+    Digests of the last successful reconcile, per listener and object key.
+    """
+
+    def __init__(self):
+        self.digests = {}
+        self.lock = threading.Lock()
+
+    def get(self, listener: str, key):
+        with self.lock:
+            return self.digests.get(key, {}).get(listener)
+
+    def set(self, listener: str, key, digest: str):
+        with self.lock:
+            self.digests.setdefault(key, {})[listener] = digest
+
+    def forget(self, key):
+        with self.lock:
+            self.digests.pop(key, None)
+
+
+class Resyncer:
+    """
+    Remembers the last event of every object, and periodically emits it again.
+    """
+
+    def __init__(self, emit, period: float, rate: float = None):
+        """
+        :param emit: callable that is called with (key, source, event) for every resync
+        :param float period: seconds in which every object is resynced once
+        :param float rate: (optional) maximum number of resyncs per second
+        """
+        self.logger = logging.getLogger('skafos')
+        self.emit = emit
+        self.period = period
+        self.limiter = TokenBucket(rate, burst=1) if rate else None
+
+        self.objects = {}  # key -> (source, event)
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+
+    def offset(self, key) -> float:
+        """
+        :return: float, seconds after the start of a period at which `key` is resynced
+        """
+        return zlib.crc32(repr(key).encode('utf-8')) / 2 ** 32 * self.period
+
+    def observe(self, key, source, event):
+        """
+        Records the last event of an object, called for every event received from the stream.
+        """
+        with self.lock:
+            if event['type'] == 'DELETED':
+                self.objects.pop(key, None)
+            else:
+                self.objects[key] = (source, event)
+
+    def is_current(self, key, raw_object) -> bool:
+        """
+        A resync can be queued just before the object is deleted or changed. This checks, when the resync is
+        handled, whether it is still the last known state of the object.
+
+        :return: bool, whether `raw_object` is the object of the last event of `key`
+        """
+        with self.lock:
+            item = self.objects.get(key)
+        return item is not None and item[1]['raw_object'] is raw_object
+
+    def run(self):
+        while not self.stopped.is_set():
+            period_start = time.monotonic()
+            with self.lock:
+                keys = sorted(self.objects, key=self.offset)
+
+            for key in keys:
+                if self.stopped.wait(max(0.0, period_start + self.offset(key) - time.monotonic())):
+                    return
+                if self.limiter:
+                    self.limiter.acquire()
+                with self.lock:
+                    item = self.objects.get(key)
+                if item is None:
+                    continue  # Deleted in the meantime
+
+                try:
+                    self.emit(key, *item)
+                    METRICS.inc('skafos_resync_events_total')
+                except Exception:
+                    self.logger.exception('failed to resync %s', str(key))
+
+            self.stopped.wait(max(0.0, period_start + self.period - time.monotonic()))
+
+    def start(self):
+        threading.Thread(target=self.run, daemon=True, name='resync').start()
+
+    def stop(self):
+        self.stopped.set()
@@ -1,17 +1,34 @@
 """
 Main class of operator
 """
+import json
 import logging
 import threading
-from queue import Queue
+import time
+from contextlib import ExitStack
 from threading import Lock
 from typing import Union
 
 from kubernetes import client, watch
+from kubernetes.client.rest import ApiException
 
 from skafos import crdregistration
-from skafos.healthcheck import start_healthcheck, beat_healthcheck
+from skafos.cluster import Cluster, Stream, DEFAULT_CLUSTER
+from skafos.coalesce import WriteCoalescer
+from skafos.compact import CompactEvent
+from skafos.event_listener import EventListener
+from skafos.healthcheck import start_healthcheck, beat_healthcheck, add_liveness_check, add_readiness_check, \
+    set_ready
 from skafos.leaderelection import become_leader
+from skafos.metrics import METRICS
+from skafos.processpool import ProcessPool, RemoteListener
+from skafos.resync import DigestStore, Resyncer, object_digest
+from skafos.tracing import TRACER
+from skafos.watchdog import Watchdog
+from skafos.workerpool import WorkerPool
+
+HTTP_STATUS_GONE = 410
+MAX_RECONNECT_BACKOFF_SEC = 60
 
 
 class StreamWatch:
@@ -20,7 +37,8 @@ class StreamWatch:
     """
     __active = False
 
-    def __init__(self, target: Union[str, dict], listeners: list, config: dict = None):
+    def __init__(self, target: Union[str, dict], listeners: list, config: dict = None,
+                 qps: float = None, burst: int = 10, coalesce_delay: float = None, clusters: dict = None):
         """
         Client and Gauge will be passed to EventListener objects as they are created. the target must be a path
         to a crd.yaml file or a dict. In case of a dictionary the following keys are expected:
@@ -28,6 +46,12 @@ class StreamWatch:
         * (optional) kwargs dict
         * method: method that returns a reference to a method of the kubernetes.client.api_client.ApiClient
         * (optional) api: kubernetes.client.api_client.ApiClient
+        * (optional) transform: callable applied to every `raw_object` dict before it is queued,
+          e.g. `skafos.compact.strip_object` or `skafos.compact.projection('spec.image')`
+        * (optional) label_selector, field_selector: str, to let the apiserver filter the watched objects
+        * (optional) namespaces: list, watch every namespace in a separate stream; `method` should return a
+          namespaced list method, e.g. `lambda x: x.list_namespaced_pod`
+        * (optional) label_shards: list of label selectors, watch every shard in a separate stream
 
         For example:
         {
@@ -35,21 +59,58 @@ class StreamWatch:
             'kwargs': {'named': 'parameters'}
             'method': lambda x: x.some_method
             'api': client.CoreV1Api
+            'transform': strip_object,
+            'label_selector': 'app=web',
+            'namespaces': ['team-a', 'team-b']
         }
 
         :param target:
         :param [] listeners:
         :param config:
+        :param float qps: (optional) maximum requests per second of all listeners together
+        :param int burst: (optional) number of requests listeners can make at once, when `qps` is set
+        :param float coalesce_delay: (optional) enables `listener.coalescer`, which merges patches to the same
+                                     object that are made within this number of seconds
+        :param dict clusters: (optional) cluster name -> client.Configuration, to reconcile objects of several
+                              clusters instead of only the cluster of `config`
         """
         self.logger = logging.getLogger('skafos')
 
         self.target = target
         self.listeners = listeners
-
-        self.config = config
-        self.api_client = client.api_client.ApiClient(configuration=config)
+        self.transform = target.get('transform') if isinstance(target, dict) else None
+
+        self.clusters = {name: Cluster(name, cluster_config, qps, burst)
+                         for name, cluster_config in (clusters or {DEFAULT_CLUSTER: config}).items()}
+        default_cluster = next(iter(self.clusters.values()))
+
+        self.config = default_cluster.config
+        self.api_client = default_cluster.api_client
+        self.cache = default_cluster.cache
+        self.coalescer = WriteCoalescer(coalesce_delay) if coalesce_delay else None
+        self.process_pool = None
+        self.watchdog = Watchdog()
+        self.resyncer = None
+        self.digests = DigestStore()
+        # Only label shards can deliver events of the same object in different streams, see `is_stale`
+        self.track_versions = isinstance(target, dict) and len(target.get('label_shards') or []) > 1
+        self.versions = {}  # key -> (resourceVersion, stream) of the last event of every object
+        self.versions_lock = Lock()
+        self.stopped = threading.Event()
         self.lock = Lock()
 
+    def create_api_client(self, cluster: str = None):
+        """
+        :param str cluster: (optional) name of the cluster, defaults to the first cluster
+        :return: ListenerApiClient, a new ApiClient for a listener that shares the rate limiter of the cluster
+        """
+        return self.get_cluster(cluster).create_api_client()
+
+    def get_cluster(self, name: str = None) -> Cluster:
+        if name is None:
+            return next(iter(self.clusters.values()))
+        return self.clusters[name]
+
     def reconcile(self, event):
         """
         Handles a new custom CRD event from Kubernetes event stream.
@@ -58,38 +119,124 @@ class StreamWatch:
         """
         current_event = event
 
-        if isinstance(event['object'], dict) and event['object']["metadata"].get("name") is None:
-            return
-        elif (not isinstance(event['object'], dict)) and event['object'].metadata.name is None:
+        if isinstance(event, CompactEvent):  # Don't deserialize the object when no listener reads it
+            name, namespace = event.name, event.namespace
+        elif isinstance(event['object'], dict):
+            name, namespace = event['object']["metadata"].get("name"), event['object']["metadata"].get("namespace")
+        else:
+            name, namespace = event['object'].metadata.name, event['object'].metadata.namespace
+        if name is None:
             return
+        cluster = self.get_cluster(getattr(event, 'cluster', None))
+        key = (cluster.name, namespace, name)
 
-        self.lock.acquire()
-        ev_state = {}
-        try:
+        trace = getattr(event, 'trace', None)
+        if trace:
+            TRACER.record('event.queue', trace[2], time.time_ns(), parent=trace[:2])
+
+        with TRACER.span('reconcile', parent=trace[:2] if trace else None, key=f'{namespace}/{name}',
+                         cluster=cluster.name, type=event['type']), ExitStack() as remote_listeners:
+            self.lock.acquire()
+            ev_state = {}
             processed_items = []
-            for listener in self.listeners:
-                init_listener = listener
-                if callable(listener):
-                    init_listener = listener(client.api_client.ApiClient(configuration=self.config), current_event)
-                    self.lock.release()
-
-                processed_items.append(init_listener)
-                processed_event_successfully = False
-                try:
-                    processed_event_successfully = init_listener.process(current_event, ev_state)
-                except Exception:
-                    logging.exception('listener failed to process event')
-
-                if callable(listener):
-                    self.lock.acquire()
-
-                if not processed_event_successfully:
-                    self.logger.warning("Listener returned False on event, rolling back previous changes")
-                    for old_listener in reversed(processed_items):
-                        old_listener.rollback()
-                    break  # Do not process remaining listeners; we have already failed
-        finally:
-            self.lock.release()
+            shared_digests = {}
+            reconciled = True
+            try:
+                for listener in self.listeners:
+                    init_listener = listener
+                    if callable(listener):
+                        if self.process_pool and getattr(listener, 'run_in_process', False):
+                            init_listener = RemoteListener(self.process_pool, listener, current_event)
+                            remote_listeners.callback(init_listener.release)  # Also when it skips a resync
+                        else:
+                            init_listener = listener(cluster.create_api_client(), current_event)
+                        self.lock.release()
+                    elif len(self.clusters) > 1:
+                        # A listener instance is shared by all clusters, and only used while holding the lock
+                        init_listener.api_client = cluster.shared_api_client
+
+                    init_listener.cluster = cluster.name
+                    init_listener.cache = cluster.cache
+                    init_listener.coalescer = self.coalescer
+                    if getattr(current_event, 'resync', False) and \
+                            not self.needs_resync(init_listener, current_event, ev_state, key):
+                        if callable(listener):
+                            self.lock.acquire()
+                        continue
+
+                    processed_items.append(init_listener)
+                    processed_event_successfully = False
+                    self.watchdog.begin(init_listener.get_name(), key)
+                    try:
+                        processed_event_successfully = init_listener.process(current_event, ev_state)
+                    except Exception:
+                        logging.exception('listener failed to process event')
+                    finally:
+                        self.watchdog.end()
+
+                    if callable(listener):
+                        self.lock.acquire()
+                    elif self.resyncer and not self.default_digest(init_listener):
+                        # The instance handles the next event as soon as the lock is released
+                        shared_digests[init_listener.get_name()] = init_listener.digest()
+
+                    if not processed_event_successfully:
+                        self.logger.warning("Listener returned False on event, rolling back previous changes")
+                        for old_listener in reversed(processed_items):
+                            self.watchdog.begin(old_listener.get_name() + '.rollback', key)
+                            try:
+                                with TRACER.span('listener.rollback', listener=old_listener.get_name()):
+                                    old_listener.rollback()
+                            finally:
+                                self.watchdog.end()
+                        reconciled = False
+                        break  # Do not process remaining listeners; we have already failed
+            finally:
+                self.lock.release()
+
+            if self.resyncer:
+                self.store_digests(processed_items, current_event, key, reconciled, shared_digests)
+
+    def needs_resync(self, listener, event, ev_state, key) -> bool:
+        """
+        :return: whether a listener should handle a resync event, based on the digest of its last reconcile
+        """
+        listener.process_event(event, ev_state)
+        if listener.needs_resync(self.digests.get(listener.get_name(), key)):
+            METRICS.inc('skafos_resync_reconciles_total', listener=listener.get_name())
+            return True
+        METRICS.inc('skafos_resync_skipped_total', listener=listener.get_name())
+        return False
+
+    def store_digests(self, listeners, event, key, reconciled, shared_digests: dict = None):
+        """
+        Remembers what the listeners reconciled. After a failure or delete the digests are forgotten, so the
+        next resync runs all listeners again. Listeners that don't override `digest` share a single digest of
+        the object.
+
+        :param dict shared_digests: (optional) listener name -> digest, taken earlier for listener instances
+        """
+        if not reconciled or event['type'] == 'DELETED':
+            self.digests.forget(key)
+            return
+        digest = None
+        for listener in listeners:
+            if listener.get_name() in (shared_digests or {}):
+                listener_digest = shared_digests[listener.get_name()]
+            elif self.default_digest(listener):
+                digest = digest or object_digest(event['raw_object'])
+                listener_digest = digest
+            else:
+                listener_digest = listener.digest()
+            self.digests.set(listener.get_name(), key, listener_digest)
+
+    @staticmethod
+    def default_digest(listener) -> bool:
+        """
+        :return: whether the listener uses the digest of the whole object, `EventListener.digest`
+        """
+        listener_cls = listener.listener_cls if isinstance(listener, RemoteListener) else type(listener)
+        return getattr(listener_cls, 'digest', None) is EventListener.digest
 
     @staticmethod
     def create_config(ssl_path):
@@ -119,80 +266,327 @@ class StreamWatch:
         else:
             self.logger.info("No need to register, as CRD is already registered")
 
-    def get_stream_config(self):
+    def get_stream_config(self, api_client=None):
+        """
+        :param api_client: (optional) ApiClient of the cluster to watch, defaults to `self.api_client`
+        :return: api, args, kwargs, method of the watch
+        """
+        api_client = api_client or self.api_client
         if isinstance(self.target, str):
-            api = client.CustomObjectsApi(self.api_client)
+            api = client.CustomObjectsApi(api_client)
 
             group, version, plural, singular = crdregistration.get_crd_config(self.target)
-            self.register_crd(self.api_client, singular)
+            self.register_crd(api_client, singular)
 
             return api, [group, version, plural], {}, lambda x: x.list_cluster_custom_object
 
         elif isinstance(self.target, dict):
             if 'api' in self.target:
-                api = self.target['api'](self.api_client)
+                api = self.target['api'](api_client)
             else:
-                api = client.CoreV1Api(self.api_client)
+                api = client.CoreV1Api(api_client)
+
+            kwargs = dict(self.target.get('kwargs', {}))
+            for selector in ('label_selector', 'field_selector'):
+                if self.target.get(selector):
+                    kwargs[selector] = self.target[selector]
 
-            return api, self.target.get('args', []), self.target.get('kwargs', {}), self.target['method']
+            return api, self.target.get('args', []), kwargs, self.target['method']
 
-    def run(self, timeout=7200, n_threads=48, healthcheck_port=5000, leader_election_ns=''):
+    def get_partitions(self):
+        """
+        Splits the watch of a dict target into several narrower watches: one per namespace in `namespaces`,
+        and/or one per label selector in `label_shards`.
+
+        :return: list of (name, kwargs), the name and extra watch arguments of every partition
+        """
+        if not isinstance(self.target, dict):
+            return [('all', {})]
+
+        partitions = [('all', {})]
+        if self.target.get('namespaces'):
+            partitions = [(f'namespace={namespace}', {'namespace': namespace})
+                          for namespace in self.target['namespaces']]
+
+        if self.target.get('label_shards'):
+            base_selector = self.target.get('label_selector') or self.target.get('kwargs', {}).get('label_selector')
+            shards = []
+            for name, kwargs in partitions:
+                for shard in self.target['label_shards']:
+                    selector = f'{base_selector},{shard}' if base_selector else shard
+                    shard_name = shard if name == 'all' else f'{name},{shard}'
+                    shards.append((shard_name, dict(kwargs, label_selector=selector)))
+            partitions = shards
+
+        return partitions
+
+    def run(self, timeout=7200, n_threads=48, healthcheck_port=5000, leader_election_ns='', min_threads=1,
+            n_processes=0, stuck_timeout=600, max_pending=1000, resync_period=None, resync_rate=None,
+            cluster_threads=None, profiling=False):
         """
         This function will continuously watch and process the kubernetes event stream for
-        CRD events. This is a (perpetually) blocking operation.
+        CRD events. This is a (perpetually) blocking operation, until `stop` is called.
+
+        Events are handled by a pool of worker threads that grows up to `n_threads` when events queue up,
+        and shrinks back to `min_threads` when idle. Listener classes with `run_in_process = True` are executed
+        in a pool of `n_processes` worker processes, when it is set.
+
+        Every cluster, and every partition of the target (see `get_partitions`), has its own event stream. A stream
+        can have at most `max_pending` events queued or in progress; it is paused until some are handled. Workers
+        take events round-robin from the clusters, and at most `cluster_threads` (by default an equal share of
+        `n_threads`) workers handle events of the same cluster, so a slow cluster can't starve the others.
+
+        When `resync_period` (seconds) is set, every object is resynced once per period as a MODIFIED event, spread
+        evenly over the period and at most `resync_rate` per second. Listeners skip a resync when the object did
+        not change since their last successful reconcile (see `EventListener.needs_resync`).
+
+        The process is reported as not alive (`/livez`) when a listener call takes longer than `stuck_timeout`
+        seconds, and as ready (`/readyz`) once all event streams of at least one cluster are running. The health check
+        port only serves `/debug/profile` when `profiling` is set.
         """
-        api, args, kwargs, method = self.get_stream_config()
-        start_healthcheck(timeout + 60, port=healthcheck_port)
+        start_healthcheck(timeout + 60, port=healthcheck_port, profiling=profiling)
+        self.watchdog.stuck_timeout = stuck_timeout
+        self.watchdog.start()
+        add_liveness_check(self.watchdog.check)
+        add_liveness_check(self.check_streams)
+        add_readiness_check(self.check_clusters)
 
         if leader_election_ns:
             become_leader(leader_election_ns)
 
-        def worker(index, jobs):
-            logging.debug('Worker %d up', index)
-            while True:
-                job = jobs.get()
-                try:
-                    logging.debug('Worker %d (%s) is processing a job', index, threading.currentThread().getName())
-                    self.reconcile(job)
-                    logging.debug('Worker %d (%s) has %d jobs left in queue',
-                                  index, threading.currentThread().getName(), jobs.qsize())
-                except Exception as ex:
-                    logging.error('Worker %d (%s) failed: %s', index, threading.currentThread().getName(), str(ex))
-
-        # Every worker (in its own thread) has a queue. New events get hashed by name to a queue index.
-        # When there are multiple events for the same object they end up in the same queue, no race conditions.
-        queues = [Queue() for _ in range(n_threads)]
-
-        threads = []
-        for i in range(n_threads):
-            t = threading.Thread(target=worker, args=(i, queues[i]), daemon=True)
-            t.start()
-            threads.append(t)
-
-        resource_version = 0
-        while True:
-            self.logger.info("(re)starting stream")
-            watcher = watch.Watch()
-            stream = watcher.stream(method(api), *args, **kwargs,
-                                    resource_version=resource_version, timeout_seconds=timeout)
+        if n_processes:
+            self.process_pool = ProcessPool(n_processes, self.config,
+                                            {name: cluster.config for name, cluster in self.clusters.items()})
+
+        # Events for the same object share a key, the pool handles them in order: no race conditions.
+        pool = WorkerPool(self.handle, min_workers=min_threads, max_workers=n_threads, group=lambda key: key[0],
+                          max_group_workers=cluster_threads or max(1, n_threads // len(self.clusters)))
+        pool.start()
+
+        if resync_period:
+            def emit(key, stream, event):
+                self.enqueue_resync(key, stream, pool, event)
+
+            self.resyncer = Resyncer(emit, resync_period, resync_rate)
+            self.resyncer.start()
+
+        partitions = self.get_partitions()
+        for cluster in self.clusters.values():
+            cluster.streams = [Stream(cluster, name, kwargs, max_pending) for name, kwargs in partitions]
+            for stream in cluster.streams:
+                stream.thread = threading.Thread(target=self.watch_stream, args=(stream, pool, timeout),
+                                                 daemon=True, name=f'stream-{cluster.name}-{stream.name}')
+                stream.thread.start()
+        set_ready()
+
+        while not self.stopped.wait(1):
+            pass
+
+    def stop(self):
+        """
+        Stops the event streams. Note that a stream only notices this after its next event or timeout.
+        """
+        self.stopped.set()
+        if self.resyncer:
+            self.resyncer.stop()
+        for cluster in self.clusters.values():
+            for stream in cluster.streams:
+                if stream.watcher:
+                    stream.watcher.stop()
+
+    def watch_stream(self, stream: Stream, pool: WorkerPool, timeout: int):
+        """
+        Watches a single event stream and queues its events, until `stop` is called. Reconnects with an
+        exponential backoff when the cluster is unreachable.
+        """
+        stream_config = None
+        backoff = 1
+        while not self.stopped.is_set():
+            try:
+                if stream_config is None:
+                    stream_config = self.get_stream_config(stream.cluster.api_client)
+                api, args, kwargs, method = stream_config
+                if stream.expired:
+                    self.relist(stream, pool, method(api), args, dict(kwargs, **stream.kwargs))
+
+                self.logger.info("(re)starting stream %s of cluster %s", stream.name, stream.cluster.name)
+                stream.watcher = watch.Watch()
+                events = stream.watcher.stream(self.watch_request(stream, method(api)), *args,
+                                               **dict(kwargs, **stream.kwargs),
+                                               resource_version=stream.resource_version, timeout_seconds=timeout)
+                for new_event in events:
+                    beat_healthcheck()
+                    self.logger.debug("%s rv: %s", stream.name, str(stream.resource_version))
+                    self.logger.debug(new_event)
+                    if new_event["type"] == "ERROR" and new_event["object"]["reason"] == "Expired":
+                        stream.expired = True
+                        stream.watcher.stop()
+                    else:
+                        self.enqueue(stream, pool, new_event)
+
+                backoff = 1
+
+            except ApiException as ex:
+                if ex.status == HTTP_STATUS_GONE:
+                    self.logger.info("resourceVersion of stream %s of cluster %s expired, listing all objects",
+                                     stream.name, stream.cluster.name)
+                    stream.expired = True
+                    continue
+                self.disconnected(stream, str(ex), backoff)
+                backoff = min(backoff * 2, MAX_RECONNECT_BACKOFF_SEC)
+            except Exception as ex:
+                self.disconnected(stream, str(ex), backoff)
+                backoff = min(backoff * 2, MAX_RECONNECT_BACKOFF_SEC)
+
+    def relist(self, stream: Stream, pool: WorkerPool, func, args: list, kwargs: dict):
+        """
+        Lists all objects of a stream after its resourceVersion expired, and queues them as ADDED events. Objects
+        that were deleted while the stream was expired get a DELETED event with their last known state, otherwise
+        they would be resynced and remembered forever.
+        """
+        result = json.loads(func(*args, **kwargs, _preload_content=False).data)
+        kind = result.get('kind', '')
+        kind = kind[:-len('List')] if kind.endswith('List') else kind
+
+        listed = set()
+        for item in result.get('items') or []:
+            item.setdefault('apiVersion', result.get('apiVersion'))
+            item.setdefault('kind', kind)  # Items of a list don't have their own kind and apiVersion
+            metadata = item.get('metadata') or {}
+            listed.add((stream.cluster.name, metadata.get('namespace'), metadata.get('name') or 'anonymous'))
+            self.enqueue(stream, pool, {'type': 'ADDED', 'object': item})
+
+        deleted = {}
+        if self.resyncer:
+            with self.resyncer.lock:
+                deleted = {key: event for key, (source, event) in self.resyncer.objects.items()
+                           if source is stream and key not in listed}
+        with self.versions_lock:
+            for key in [key for key, (_, source) in self.versions.items()
+                        if source is stream and key not in listed and key not in deleted]:
+                del self.versions[key]
+
+        for key, event in deleted.items():
+            self.logger.info("%s was deleted while stream %s was expired", str(key), stream.name)
+            self.enqueue(stream, pool, CompactEvent('DELETED', event.raw_object, event.model))
+
+        stream.resource_version = result['metadata'].get('resourceVersion')
+        stream.expired = False
+
+    @staticmethod
+    def watch_request(stream: Stream, func):
+        """
+        Wraps the list method of a watch, so the stream is marked connected (and the health check beats) as soon
+        as the apiserver accepted the watch request, also when no events arrive.
+
+        `Watch` finds the model of the objects in the docstring of the method, and deserializes every object
+        in the reader thread. The wrapper has no docstring, so `Watch` yields dicts; the model is kept in
+        `stream.model` instead, and `CompactEvent` only deserializes an object when a listener reads it.
+        """
+        model = stream.watcher.get_return_type(func)
+        stream.model = model if model and model != 'object' else None  # Custom objects are dicts
+
+        def request(*args, **kwargs):
+            response = func(*args, **kwargs)
             beat_healthcheck()
+            stream.set_connected(True)
+            return response
+
+        return request
+
+    def disconnected(self, stream: Stream, error: str, backoff: float):
+        self.logger.warning("stream %s of cluster %s failed, retrying in %d seconds: %s",
+                            stream.name, stream.cluster.name, backoff, error)
+        stream.set_connected(False, error)
+        self.stopped.wait(backoff)
+
+    def enqueue(self, stream: Stream, pool: WorkerPool, new_event: dict):
+        cluster = stream.cluster
+        with TRACER.span('event.receive', type=new_event['type'], cluster=cluster.name) as span:
+            new_event = CompactEvent.from_event(new_event, self.transform, stream.model)
+            new_event.cluster = cluster.name
+            if new_event.resource_version:
+                stream.resource_version = new_event.resource_version
+            if TRACER.enabled:
+                span.set_attribute('key', f'{new_event.namespace}/{new_event.name}')
+                new_event.trace = span.context() + (time.time_ns(),)
+
+            key = (cluster.name, new_event.namespace, new_event.name or 'anonymous')
+            if self.is_stale(key, stream, new_event):
+                self.logger.debug("dropping stale event %s of stream %s", new_event, stream.name)
+                METRICS.inc('skafos_stale_events_total', cluster=cluster.name, stream=stream.name)
+                return
+            if self.resyncer:
+                # A separate event, so the model that reconcile deserializes isn't kept until the next resync
+                self.resyncer.observe(key, stream, CompactEvent(new_event.type, new_event.raw_object, new_event.model,
+                                                                cluster.name))
+
+            stream.acquire()
+            pool.put(key, (stream, new_event))
+
+    def is_stale(self, key, stream: Stream, event: CompactEvent) -> bool:
+        """
+        Whether an event is older than the last event of the same object. Events of a single stream are ordered,
+        but events of different label shards are not: when an object moves to another shard, the DELETED event of
+        the old shard can arrive after the ADDED event of the new shard, with the same resourceVersion.
+        """
+        if not self.track_versions or event.resource_version is None:
+            return False
+        with self.versions_lock:
+            last_version, last_stream = self.versions.get(key, (None, None))
+            if last_version is not None:
+                try:
+                    if int(event.resource_version) < int(last_version):
+                        return True
+                except ValueError:
+                    pass  # resourceVersions that are not integers can't be ordered
+                if event.resource_version == last_version and event.type == 'DELETED' and last_stream is not stream:
+                    return True
+
+            if event.type == 'DELETED':
+                self.versions.pop(key, None)
+            else:
+                self.versions[key] = (event.resource_version, stream)
+        return False
 
-            for new_event in stream:
-                self.logger.debug("rv: %s", str(resource_version))
-                self.logger.debug(new_event)
-                if new_event["type"] == "ERROR" and new_event["object"]["reason"] == "Expired":
-                    watcher.stop()
-                else:
-                    event_name = 'anonymous'
-                    try:
-                        event_name = new_event['raw_object']['metadata']['name']
-                    except:
-                        pass
+    def enqueue_resync(self, key, stream: Stream, pool: WorkerPool, event: CompactEvent):
+        """
+        Queues the last known state of an object again, as a MODIFIED event.
+        """
+        resync_event = CompactEvent('MODIFIED', event.raw_object, event.model, event.cluster)
+        resync_event.resync = True
+        stream.acquire()
+        pool.put(key, (stream, resync_event))
 
-                    designated_worker = hash(event_name) % n_threads
-                    queues[designated_worker].put(new_event)
+    def handle(self, job):
+        """
+        Reconciles a queued event, and makes room for the next event of its stream. Resyncs of objects that
+        were deleted or changed since the resync was queued are dropped.
+        """
+        stream, event = job
+        try:
+            key = (event.cluster, event.namespace, event.name or 'anonymous')
+            if event.resync and not self.resyncer.is_current(key, event.raw_object):
+                self.logger.debug("dropping resync of %s, a newer event was received", str(key))
+                METRICS.inc('skafos_resync_stale_total')
+                return
+            self.reconcile(event)
+        finally:
+            stream.release()
+
+    def check_clusters(self):
+        """
+        Readiness check, all event streams of at least one cluster should be running.
+        """
+        statuses = '\n'.join(cluster.status() for cluster in self.clusters.values())
+        return any(cluster.connected for cluster in self.clusters.values()), statuses
 
-                    self.logger.debug("Thread count: " + str(threading.active_count()))
-                    for i, t in enumerate(threads):  # Health Check
-                        if not t.is_alive():
-                            raise Exception('Worker ' + str(i) + ' is not alive')
+    def check_streams(self):
+        """
+        Liveness check, all event stream threads should be running.
+        """
+        for cluster in self.clusters.values():
+            for stream in cluster.streams:
+                if stream.thread and not stream.thread.is_alive() and not self.stopped.is_set():
+                    return False, f'Event stream {stream.name} of cluster {cluster.name} is not running'
+        return True, 'Ok'
@@ -0,0 +1,252 @@
+"""
+Lightweight tracing of events through the operator: receipt, queueing, every listener call and every
+request to the apiserver. Spans are only created when a sink is set, otherwise the hooks cost a single
+attribute lookup.
+
+For example, to write spans in the OpenTelemetry (OTLP/JSON) format to a local file:
+    from skafos.tracing import TRACER, OTLPFileSink
+    TRACER.set_sink(OTLPFileSink('/tmp/spans.jsonl'))
+"""
+import atexit
+import json
+import logging
+import random
+import threading
+import time
+
+STATUS_UNSET = 0
+STATUS_ERROR = 2
+
+
+class Span:
+    __slots__ = ('tracer', 'name', 'trace_id', 'span_id', 'parent_id', 'start', 'end', 'attributes', 'status')
+
+    def __init__(self, tracer, name: str, trace_id: int, parent_id: int = None, attributes: dict = None):
+        self.tracer = tracer
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = random.getrandbits(64)
+        self.parent_id = parent_id
+        self.start = None
+        self.end = None
+        self.attributes = attributes or {}
+        self.status = STATUS_UNSET
+
+    def __enter__(self):
+        self.tracer.stack().append(self)
+        self.start = time.time_ns()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.end = time.time_ns()
+        if exc_type:
+            self.status = STATUS_ERROR
+            self.attributes['exception'] = repr(exc_value)
+
+        stack = self.tracer.stack()
+        if stack and stack[-1] is self:
+            stack.pop()
+        self.tracer.export(self)
+
+    def set_attribute(self, key: str, value):
+        self.attributes[key] = value
+
+    def context(self):
+        """
+        :return: (trace_id, span_id), to continue this trace in another thread
+        """
+        return self.trace_id, self.span_id
+
+
+class NoopSpan:
+    """
+    Returned when tracing is disabled.
+    """
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return None
+
+    def set_attribute(self, key: str, value):
+        return None
+
+    def context(self):
+        return None
+
+
+NOOP_SPAN = NoopSpan()
+
+
+class Tracer:
+    def __init__(self):
+        self.logger = logging.getLogger('skafos')
+        self.sink = None
+        self.local = threading.local()
+
+    def set_sink(self, sink):
+        """
+        :param sink: object with an `export(span)` method, or None to disable tracing
+        """
+        self.sink = sink
+
+    @property
+    def enabled(self) -> bool:
+        return self.sink is not None
+
+    def stack(self) -> list:
+        stack = getattr(self.local, 'stack', None)
+        if stack is None:
+            stack = self.local.stack = []
+        return stack
+
+    def span(self, name: str, parent=None, **attributes):
+        """
+        Creates a span to be used as context manager. Without `parent` the span is a child of the
+        current span of this thread, if any.
+
+        :param str name: name of the span
+        :param parent: (optional) (trace_id, span_id) as returned by `Span.context`
+        """
+        if self.sink is None:
+            return NOOP_SPAN
+
+        if parent is None:
+            stack = self.stack()
+            parent = stack[-1].context() if stack else None
+        if parent is None:
+            return Span(self, name, random.getrandbits(128), None, attributes)
+        return Span(self, name, parent[0], parent[1], attributes)
+
+    def record(self, name: str, start: int, end: int, parent=None, **attributes):
+        """
+        Exports a span that already finished, e.g. the time an event spent in a queue.
+
+        :param int start: start time in nanoseconds since epoch
+        :param int end: end time in nanoseconds since epoch
+        """
+        if self.sink is None:
+            return
+        span = self.span(name, parent, **attributes)
+        span.start, span.end = start, end
+        self.export(span)
+
+    def export(self, span: Span):
+        sink = self.sink
+        if sink is None:
+            return
+        try:
+            sink.export(span)
+        except Exception:
+            self.logger.exception('failed to export span')
+
+
+class MemorySink:
+    """
+    Keeps the last `size` spans in memory.
+    """
+    def __init__(self, size: int = 10000):
+        self.size = size
+        self.spans = []
+        self.lock = threading.Lock()
+
+    def export(self, span: Span):
+        with self.lock:
+            self.spans.append(span)
+            if len(self.spans) > self.size:
+                del self.spans[:len(self.spans) - self.size]
+
+
+def otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+
+def otlp_span(span: Span) -> dict:
+    """
+    :return: dict, the span in the OTLP/JSON format
+    """
+    result = {
+        'traceId': format(span.trace_id, '032x'),
+        'spanId': format(span.span_id, '016x'),
+        'name': span.name,
+        'kind': 1,  # SPAN_KIND_INTERNAL
+        'startTimeUnixNano': str(span.start),
+        'endTimeUnixNano': str(span.end),
+        'attributes': [{'key': k, 'value': otlp_value(v)} for k, v in span.attributes.items()],
+        'status': {'code': span.status}
+    }
+    if span.parent_id is not None:
+        result['parentSpanId'] = format(span.parent_id, '016x')
+    return result
+
+
+class OTLPFileSink:
+    """
+    Writes spans as OTLP/JSON `ExportTraceServiceRequest` objects to a file, one per line. This format
+    can be read by the OpenTelemetry collector (`otlpjsonfile` receiver). A batch is written when it is
+    full, every `flush_interval` seconds and when the process exits.
+    """
+    def __init__(self, path: str, service_name: str = 'skafos', batch_size: int = 100, flush_interval: float = 5):
+        """
+        :param str path: file to append spans to
+        :param str service_name: (optional) value of the `service.name` resource attribute
+        :param int batch_size: (optional) maximum number of spans written per line
+        :param float flush_interval: (optional) seconds after which spans are written, also if the batch isn't full
+        """
+        self.path = path
+        self.service_name = service_name
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.batch = []
+        self.lock = threading.Lock()
+
+        atexit.register(self.flush)
+        threading.Thread(target=self.run, daemon=True, name='otlp-file-sink').start()
+
+    def run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception:
+                logging.getLogger('skafos').exception('failed to write spans to %s', self.path)
+
+    def export(self, span: Span):
+        with self.lock:
+            self.batch.append(otlp_span(span))
+            if len(self.batch) >= self.batch_size:
+                self.write()
+
+    def flush(self):
+        with self.lock:
+            self.write()
+
+    def write(self):
+        """
+        Writes the current batch, must be called while holding the lock.
+        """
+        if not self.batch:
+            return
+        request = {
+            'resourceSpans': [{
+                'resource': {
+                    'attributes': [{'key': 'service.name', 'value': otlp_value(self.service_name)}]
+                },
+                'scopeSpans': [{
+                    'scope': {'name': 'skafos'},
+                    'spans': self.batch
+                }]
+            }]
+        }
+        with open(self.path, 'a') as output:
+            output.write(json.dumps(request) + '\n')
+        self.batch = []
+
+
+TRACER = Tracer()
@@ -0,0 +1,120 @@
+"""
+Detects workers that are stuck in a listener. Workers record cheap per-thread heartbeats around every
+listener call; a separate watchdog thread periodically scans them, so nothing is checked on the path
+of an event.
+"""
+import logging
+import threading
+import time
+
+from skafos.metrics import METRICS
+
+
+class Heartbeat:
+    """
+    Progress of a single worker thread. Only written by that thread, only read by the watchdog.
+    """
+    __slots__ = ('thread', 'started', 'listener', 'key', 'reported')
+
+    def __init__(self, thread):
+        self.thread = thread
+        self.started = None
+        self.listener = None
+        self.key = None
+        self.reported = False
+
+
+class Watchdog:
+    """
+    Reports workers that have been busy with a single listener call for longer than `stuck_timeout` seconds.
+    """
+
+    def __init__(self, stuck_timeout: float = 600, interval: float = 10):
+        """
+        :param float stuck_timeout: (optional) seconds after which a listener call is considered stuck
+        :param float interval: (optional) seconds between two scans
+        """
+        self.logger = logging.getLogger('skafos')
+        self.stuck_timeout = stuck_timeout
+        self.interval = interval
+
+        self.heartbeats = []
+        self.stuck = []
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.thread = None
+
+    def heartbeat(self) -> Heartbeat:
+        heartbeat = getattr(self.local, 'heartbeat', None)
+        if heartbeat is None:
+            heartbeat = self.local.heartbeat = Heartbeat(threading.current_thread())
+            with self.lock:
+                self.heartbeats.append(heartbeat)
+        return heartbeat
+
+    def begin(self, listener: str, key):
+        """
+        Called by a worker before it calls a listener.
+        """
+        heartbeat = self.heartbeat()
+        heartbeat.listener = listener
+        heartbeat.key = key
+        heartbeat.started = time.monotonic()
+
+    def end(self):
+        """
+        Called by a worker after a listener returned.
+        """
+        self.heartbeat().started = None
+
+    def scan(self):
+        """
+        Updates the list of stuck workers, and forgets workers whose thread has stopped.
+        """
+        now = time.monotonic()
+        with self.lock:
+            self.heartbeats = [x for x in self.heartbeats if x.thread.is_alive()]
+            heartbeats = list(self.heartbeats)
+
+        stuck = []
+        for heartbeat in heartbeats:
+            started = heartbeat.started
+            if started is None or now - started < self.stuck_timeout:
+                heartbeat.reported = False
+                continue
+
+            stuck.append((heartbeat.thread.name, heartbeat.listener, heartbeat.key, now - started))
+            if not heartbeat.reported:
+                heartbeat.reported = True
+                self.logger.warning('%s is stuck in %s for %s since %d seconds', heartbeat.thread.name,
+                                    heartbeat.listener, str(heartbeat.key), now - started)
+
+        self.stuck = stuck
+        METRICS.set('skafos_stuck_workers', len(stuck))
+        METRICS.set('skafos_watched_workers', len(heartbeats))
+
+    def check(self):
+        """
+        Liveness check for `skafos.healthcheck.add_liveness_check`.
+
+        :return: (bool, str) whether no worker is stuck
+        """
+        if self.thread and not self.thread.is_alive():
+            return False, 'Watchdog is not running'
+        stuck = self.stuck
+        if stuck:
+            return False, '\n'.join(f'{thread} is stuck in {listener} for {key} since {int(duration)} seconds'
+                                    for thread, listener, key, duration in stuck)
+        return True, 'Ok'
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.scan()
+            except Exception:
+                self.logger.exception('watchdog scan failed')
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, daemon=True, name='watchdog')
+        self.thread.start()
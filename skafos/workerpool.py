@@ -0,0 +1,177 @@
+"""
+A pool of worker threads that grows and shrinks with the amount of work. Jobs are queued per key; jobs
+with the same key are handled one at a time and in the order they were put, regardless of which worker
+picks them up.
+
+Keys can be divided into groups (e.g. one per cluster). Workers take keys round-robin from the groups, and a
+group can be limited to a number of busy workers, so a group with slow jobs can't occupy every worker.
+"""
+import logging
+import threading
+from collections import Counter, OrderedDict, deque
+
+from skafos.metrics import METRICS
+
+
+class WorkerPool:
+    """
+    A new worker is started when a job is put and all workers are busy (e.g. because listeners are
+    waiting on the apiserver), up to `max_workers`. Workers that have been idle for `idle_timeout`
+    seconds stop, down to `min_workers`.
+    """
+
+    def __init__(self, handler, min_workers: int = 1, max_workers: int = 48, idle_timeout: float = 60,
+                 name: str = 'worker', group=None, max_group_workers: int = None):
+        """
+        :param handler: callable that is called with every job
+        :param int min_workers: (optional) number of workers that are always running
+        :param int max_workers: (optional) maximum number of workers
+        :param float idle_timeout: (optional) seconds after which an idle worker stops
+        :param str name: (optional) name of the pool, used for thread names and metric labels
+        :param group: (optional) callable that returns the group of a key, all keys are in one group by default
+        :param int max_group_workers: (optional) maximum number of workers busy with keys of the same group
+        """
+        self.logger = logging.getLogger('skafos')
+
+        self.handler = handler
+        self.min_workers = min_workers
+        self.max_workers = max(min_workers, max_workers)
+        self.idle_timeout = idle_timeout
+        self.name = name
+        self.group = group or (lambda key: None)
+        self.max_group_workers = max_group_workers or self.max_workers
+
+        self.pending = {}  # key -> deque of jobs
+        self.ready = OrderedDict()  # group -> deque of keys that have pending jobs and are not being handled
+        self.active = set()  # keys that are being handled
+        self.busy = Counter()  # group -> number of keys that are being handled
+
+        self.workers = 0
+        self.idle = 0
+        self.queued = 0
+        self.counter = 0
+        self.condition = threading.Condition()
+
+    def start(self):
+        with self.condition:
+            while self.workers < self.min_workers:
+                self.spawn()
+
+    def put(self, key, job):
+        """
+        Queues a job. It is handled after all earlier jobs with the same key have been handled.
+        """
+        with self.condition:
+            jobs = self.pending.get(key)
+            if jobs is None:
+                jobs = self.pending[key] = deque()
+                if key not in self.active:
+                    self.make_ready(key)
+            jobs.append(job)
+            self.queued += 1
+
+            if self.schedulable() > self.idle and self.workers < self.max_workers:
+                self.spawn()
+                METRICS.inc('skafos_pool_scale_up_total', pool=self.name)
+            self.condition.notify()
+            METRICS.set('skafos_pool_queued_jobs', self.queued, pool=self.name)
+
+    def make_ready(self, key):
+        self.ready.setdefault(self.group(key), deque()).append(key)
+
+    def schedulable(self) -> int:
+        """
+        :return: int, number of ready keys in groups that can get another worker
+        """
+        return sum(len(keys) for group, keys in self.ready.items() if self.busy[group] < self.max_group_workers)
+
+    def next_key(self):
+        """
+        Takes the first ready key of the next group that can get another worker, must be called while holding
+        the condition.
+
+        :return: key, or None if there is none
+        """
+        for group, keys in self.ready.items():
+            if self.busy[group] < self.max_group_workers:
+                key = keys.popleft()
+                if keys:
+                    self.ready.move_to_end(group)  # Round-robin: the other groups go first next time
+                else:
+                    del self.ready[group]
+                self.busy[group] += 1
+                return key
+        return None
+
+    def spawn(self):
+        """
+        Starts a new worker, must be called while holding the condition.
+        """
+        self.workers += 1
+        self.counter += 1
+        METRICS.set('skafos_pool_workers', self.workers, pool=self.name)
+        threading.Thread(target=self.work, args=(self.counter,), daemon=True,
+                         name=f'{self.name}-{self.counter}').start()
+
+    def take(self):
+        """
+        Waits for a job, must be called while holding the condition.
+
+        :return: (key, job), or None if the worker should stop
+        """
+        key = self.next_key()
+        while key is None:
+            self.idle += 1
+            got_work = self.condition.wait(self.idle_timeout)
+            self.idle -= 1
+            key = self.next_key()
+            if key is None and not got_work and self.workers > self.min_workers:
+                return None
+
+        jobs = self.pending[key]
+        job = jobs.popleft()
+        if not jobs:
+            del self.pending[key]
+        self.active.add(key)
+        self.queued -= 1
+        return key, job
+
+    def done(self, key):
+        with self.condition:
+            self.active.discard(key)
+            self.busy[self.group(key)] -= 1
+            if key in self.pending:
+                self.make_ready(key)
+            if self.ready:
+                self.condition.notify()  # The key, or a key of a group that was at its limit, can be taken
+            METRICS.set('skafos_pool_queued_jobs', self.queued, pool=self.name)
+
+    def work(self, index):
+        self.logger.debug('Worker %d up', index)
+        try:
+            while True:
+                with self.condition:
+                    item = self.take()
+                    if item is None:
+                        self.logger.debug('Worker %d idle, stopping', index)
+                        METRICS.inc('skafos_pool_scale_down_total', pool=self.name)
+                        return
+                key, job = item
+
+                try:
+                    self.handler(job)
+                except Exception as ex:
+                    self.logger.error('Worker %d failed: %s', index, str(ex))
+                finally:
+                    self.done(key)
+        finally:
+            with self.condition:
+                self.workers -= 1
+                METRICS.set('skafos_pool_workers', self.workers, pool=self.name)
+                # Replace a worker that died unexpectedly, so work that is queued is still handled
+                ready = self.schedulable()
+                if ready and self.workers < self.min_workers + ready and self.workers < self.max_workers:
+                    self.spawn()
+
+    def qsize(self) -> int:
+        return self.queued
@@ -0,0 +1,98 @@
+import unittest
+from unittest.mock import MagicMock, patch
+
+from skafos.cache import CachedClient, Informer, match_labels, newer_or_equal
+
+
+def fake_object(name, namespace='default', resource_version='1', labels=None):
+    return {
+        'metadata': {
+            'name': name,
+            'namespace': namespace,
+            'resourceVersion': resource_version,
+            'labels': labels or {}
+        }
+    }
+
+
+class TestCache(unittest.TestCase):
+    @staticmethod
+    def fake_api():
+        api = MagicMock()
+        api.list_secret_for_all_namespaces.return_value = {
+            'metadata': {'resourceVersion': '10'},
+            'items': [fake_object('a', labels={'app': 'web'}), fake_object('b', namespace='other')]
+        }
+        return api
+
+    def test_match_labels(self):
+        labels = {'app': 'web', 'tier': 'front'}
+        assert match_labels('', labels)
+        assert match_labels('app=web,tier', labels)
+        assert match_labels('app==web,tier!=db', labels)
+        assert not match_labels('app=db', labels)
+        assert not match_labels('!tier', labels)
+        assert not match_labels('owner', labels)
+
+    def test_newer_or_equal(self):
+        assert newer_or_equal('10', None)
+        assert newer_or_equal('10', '9')
+        assert not newer_or_equal('9', '10')
+        assert not newer_or_equal(None, '1')
+
+    @patch('skafos.cache.watch')
+    def test_informer(self, watch):
+        watch.Watch.return_value.stream.return_value = [
+            {'type': 'MODIFIED', 'object': fake_object('a', resource_version='11', labels={'app': 'db'})},
+            {'type': 'DELETED', 'object': fake_object('b', namespace='other', resource_version='12')},
+            {'type': 'ADDED', 'object': fake_object('c', resource_version='13')},
+        ]
+
+        informer = Informer(self.fake_api(), 'list_secret_for_all_namespaces')
+        informer.list()
+        assert informer.wait_for('10', timeout=0)
+        assert not informer.wait_for('13', timeout=0)
+        assert informer.get('b', 'other') is not None
+
+        informer.watch()
+        assert informer.wait_for('13', timeout=0)
+        assert informer.get('b', 'other') is None
+        assert informer.get('a', 'default')['metadata']['labels'] == {'app': 'db'}
+        assert [x['metadata']['name'] for x in informer.list_objects(namespace='default')] == ['a', 'c']
+        assert informer.list_objects(label_selector='app=web') == []
+
+    @patch('skafos.cache.watch')
+    def test_bookmark(self, watch):
+        watch.Watch.return_value.stream.return_value = [
+            {'type': 'BOOKMARK', 'object': {}, 'raw_object': {'metadata': {'resourceVersion': '20'}}},
+        ]
+
+        informer = Informer(self.fake_api(), 'list_secret_for_all_namespaces')
+        informer.list()
+        assert not informer.wait_for('15', timeout=0)
+
+        # No object of the informer changed, but the bookmark shows the watch is past version 15
+        informer.watch()
+        assert watch.Watch.return_value.stream.call_args[1]['allow_watch_bookmarks']
+        assert informer.wait_for('15', timeout=0)
+        assert len(informer.list_objects()) == 2
+
+    @patch('skafos.cache.Informer.start')
+    def test_cached_client(self, _):
+        api = MagicMock(return_value=self.fake_api())
+        cache = CachedClient(sync_timeout=0)
+
+        informer = cache.informer(api, 'list_secret_for_all_namespaces')
+        assert cache.informer(api, 'list_secret_for_all_namespaces') is informer
+        with self.assertRaises(TimeoutError):
+            cache.get(api, 'list_secret_for_all_namespaces', 'a', 'default')
+
+        informer.list()
+        assert cache.get(api, 'list_secret_for_all_namespaces', 'a', 'default')['metadata']['name'] == 'a'
+        assert len(cache.list(api, 'list_secret_for_all_namespaces', label_selector='app=web')) == 1
+        with self.assertRaises(TimeoutError):
+            cache.list(api, 'list_secret_for_all_namespaces', min_resource_version='11')
+
+
+if __name__ == '__main__':
+    unittest.main()
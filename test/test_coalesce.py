@@ -0,0 +1,54 @@
+import unittest
+from unittest.mock import MagicMock
+
+from skafos.coalesce import WriteCoalescer, merge_patches, mergeable
+
+
+class TestCoalesce(unittest.TestCase):
+    def test_merge_patches(self):
+        merged = merge_patches({'status': {'phase': 'Pending', 'ready': False}},
+                               {'status': {'phase': 'Running', 'message': None}})
+        assert merged == {'status': {'phase': 'Running', 'ready': False, 'message': None}}
+
+        ops = [{'op': 'add', 'path': '/a', 'value': 1}], [{'op': 'remove', 'path': '/b'}]
+        assert merge_patches(*ops) == ops[0] + ops[1]
+
+    def test_submit(self):
+        coalescer = WriteCoalescer(delay=60)  # Long enough to flush manually
+        patch = MagicMock(__name__='patch_namespaced_custom_object_status', return_value='patched')
+
+        first = coalescer.submit(patch, 'group', 'v1', 'ns', 'plural', 'name', body={'status': {'phase': 'A'}})
+        second = coalescer.submit(patch, 'group', 'v1', 'ns', 'plural', 'name', body={'status': {'phase': 'B'}})
+        other = coalescer.submit(patch, 'group', 'v1', 'ns', 'plural', 'other', body={'status': {'phase': 'C'}})
+        assert first is second
+        assert first is not other
+
+        coalescer.flush(force=True)
+        assert patch.call_count == 2
+        patch.assert_any_call('group', 'v1', 'ns', 'plural', 'name', body={'status': {'phase': 'B'}})
+        assert first.result(timeout=1) == 'patched'
+
+    def test_strategic_merge(self):
+        coalescer = WriteCoalescer(delay=60)
+        patch = MagicMock(__name__='patch_namespaced_pod_status', return_value='patched')
+        conditions = [{'type': 'Ready', 'status': 'True'}], [{'type': 'Synced', 'status': 'True'}]
+        assert not mergeable(patch, {'status': {'conditions': conditions[0]}},
+                             {'status': {'conditions': conditions[1]}})
+
+        # Strategic merge patches merge conditions by type, so the first patch is sent before the second is queued
+        first = coalescer.submit(patch, 'name', 'ns', body={'status': {'conditions': conditions[0]}})
+        second = coalescer.submit(patch, 'name', 'ns', body={'status': {'conditions': conditions[1]}})
+        assert first.result(timeout=1) == 'patched'
+        assert not second.done()
+        patch.assert_called_once_with('name', 'ns', body={'status': {'conditions': conditions[0]}})
+
+        # A json-patch after a dict patch isn't merged either
+        ops = [{'op': 'remove', 'path': '/metadata/labels/a'}]
+        third = coalescer.submit(patch, 'name', 'ns', body=ops)
+        assert second.done() and first is not third
+        coalescer.flush(force=True)
+        assert patch.call_args_list[-1][1] == {'body': ops}
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,128 @@
+import copy
+import pickle
+import unittest
+from unittest.mock import patch
+
+from kubernetes import client, watch
+
+from skafos import compact
+from skafos.cluster import Stream
+
+from skafos.compact import CompactEvent, LAST_APPLIED_ANNOTATION, deep_sizeof, projection, strip_object
+from skafos.event_listener import EventListener
+from skafos.stream_watch import StreamWatch
+
+
+def fake_raw_object(name='pod', namespace='default'):
+    return {
+        'apiVersion': 'v1',
+        'kind': 'Pod',
+        'metadata': {
+            'name': name,
+            'namespace': namespace,
+            'resourceVersion': '42',
+            'labels': {'app': 'web'},
+            'annotations': {LAST_APPLIED_ANNOTATION: '{"spec": "x"}' * 100},
+            'managedFields': [{'manager': 'kubectl', 'fieldsV1': {'f:spec': {}}}] * 10
+        },
+        'spec': {'containers': [{'name': 'web', 'image': 'nginx'}]},
+        'status': {'phase': 'Running'}
+    }
+
+
+class TestCompact(unittest.TestCase):
+    def test_strip_object(self):
+        raw = strip_object(fake_raw_object())
+        assert 'managedFields' not in raw['metadata']
+        assert raw['metadata']['annotations'] == {}
+
+        model = client.V1Pod(metadata=client.V1ObjectMeta(name='pod', managed_fields=[client.V1ManagedFieldsEntry()],
+                                                          annotations={LAST_APPLIED_ANNOTATION: '{}'}))
+        model = strip_object(model)
+        assert model.metadata.managed_fields is None
+        assert model.metadata.annotations == {}
+
+    def test_projection(self):
+        raw = projection('metadata.labels', 'spec.image', 'status.phase')(fake_raw_object())
+        assert raw == {
+            'apiVersion': 'v1',
+            'kind': 'Pod',
+            'metadata': {'name': 'pod', 'namespace': 'default', 'resourceVersion': '42', 'labels': {'app': 'web'}},
+            'spec': {},
+            'status': {'phase': 'Running'}
+        }
+
+    def test_compact_event(self):
+        raw = fake_raw_object()
+        event = CompactEvent.from_event({'type': 'ADDED', 'object': copy.deepcopy(raw), 'raw_object': raw})
+        assert event['type'] == 'ADDED'
+        assert event['object'] is event['raw_object']
+        assert (event.name, event.namespace, event.resource_version) == ('pod', 'default', '42')
+        with self.assertRaises(KeyError):
+            event['unknown']
+
+    def test_model(self):
+        raw = fake_raw_object()
+        event = CompactEvent.from_event({'type': 'MODIFIED', 'object': client.V1Pod(), 'raw_object': raw})
+        assert isinstance(event['object'], client.V1Pod)
+        assert event['object'].spec.containers[0].image == 'nginx'
+
+        unpickled = pickle.loads(pickle.dumps(event))
+        assert unpickled.model == 'V1Pod'
+        assert unpickled['raw_object'] == raw
+
+    def test_model_transform(self):
+        event = {'type': 'ADDED', 'object': client.V1Pod(), 'raw_object': fake_raw_object()}
+        stripped = CompactEvent.from_event(dict(event, raw_object=fake_raw_object()), strip_object)
+        assert isinstance(stripped['object'], client.V1Pod)
+        assert stripped['object'].metadata.managed_fields is None
+
+        # A projection drops the containers that V1PodSpec requires, so the object stays a dict
+        projected = CompactEvent.from_event(event, projection('metadata.labels', 'spec.nodeName'))
+        assert projected.model is None
+        assert projected['object']['metadata']['labels'] == {'app': 'web'}
+
+        class Recorder(EventListener):
+            labels = None
+
+            def create(self):
+                Recorder.labels = self.metadata['labels']
+
+        target = {'method': lambda x: x.list_namespaced_pod, 'transform': projection('metadata.labels')}
+        StreamWatch(target, [Recorder]).reconcile(projected)
+        assert Recorder.labels == {'app': 'web'}
+
+    def test_deserialize_once(self):
+        stream_watch = StreamWatch({'method': lambda x: x.list_namespaced_pod}, [])
+        stream = Stream(stream_watch.get_cluster(), 'all')
+        stream.watcher = watch.Watch()
+
+        # The watch yields dicts, the model is remembered by the stream
+        request = stream_watch.watch_request(stream, client.CoreV1Api(stream_watch.api_client).list_namespaced_pod)
+        assert stream.watcher.get_return_type(request) == ''
+        assert stream.model == 'V1Pod'
+
+        class Reader(EventListener):
+            def create(self):
+                assert self.event_obj.spec.containers[0].image == 'nginx'
+
+        raw_object = fake_raw_object()
+        event = CompactEvent.from_event({'type': 'ADDED', 'object': raw_object}, model=stream.model)
+        with patch('skafos.compact.deserialize', wraps=compact.deserialize) as deserialize:
+            stream_watch.reconcile(event)
+            assert deserialize.call_count == 0  # Without listeners nothing reads the object
+
+            stream_watch.listeners = [Reader, Reader]
+            stream_watch.reconcile(event)
+            assert deserialize.call_count == 1
+
+    def test_size(self):
+        events = [{'type': 'ADDED', 'object': fake_raw_object('pod-' + str(i)),
+                   'raw_object': fake_raw_object('pod-' + str(i))} for i in range(10)]
+        full_size = deep_sizeof(events)
+        compact_size = deep_sizeof([CompactEvent.from_event(x, strip_object) for x in events])
+        assert compact_size < full_size / 2
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,16 +2,16 @@ import time
 from http import client
 import unittest
 
-from skafos.healthcheck import start_healthcheck, beat_healthcheck
+from skafos.healthcheck import start_healthcheck, beat_healthcheck, add_liveness_check, set_ready, state
 
 
 class TestHealthcheck(unittest.TestCase):
     MIN_BEAT_TIME = 1
 
     @staticmethod
-    def get_health():
-        conn = client.HTTPConnection('localhost', port=5000, timeout=1)
-        conn.request('GET', '/health')
+    def get_health(path='/health', port=5000):
+        conn = client.HTTPConnection('localhost', port=port, timeout=1)
+        conn.request('GET', path)
         response = conn.getresponse()
         conn.close()
         return response.status, response.read()
@@ -37,6 +37,48 @@ class TestHealthcheck(unittest.TestCase):
         self.assertEqual(status, 200)
         self.assertEqual(body, b'Ok')
 
+    def test_probes(self):
+        start_healthcheck(60, port=5001)
+        time.sleep(0.1)
+
+        set_ready(False)
+        status, body = self.get_health('/readyz', port=5001)
+        self.assertEqual(status, 500)
+        set_ready()
+        status, body = self.get_health('/readyz', port=5001)
+        self.assertEqual(status, 200)
+
+        def failing_check():
+            return False, 'worker-1 is stuck'
+
+        add_liveness_check(failing_check)
+        try:
+            status, body = self.get_health('/livez', port=5001)
+            self.assertEqual(status, 500)
+            self.assertEqual(body, b'worker-1 is stuck')
+        finally:
+            state.liveness_checks.remove(failing_check)
+
+        status, body = self.get_health('/livez', port=5001)
+        self.assertEqual(status, 200)
+
+        status, body = self.get_health('/debug/profile?seconds=1', port=5001)
+        self.assertEqual(status, 404)
+
+    def test_profile(self):
+        start_healthcheck(60, port=5002, profiling=True)
+        time.sleep(0.1)
+
+        status, body = self.get_health('/debug/profile?seconds=0.2', port=5002)
+        self.assertEqual(status, 200)
+        # Folded stacks: the thread running serve_forever is sampled as well
+        self.assertIn(b'healthcheck.py:serve_forever', body)
+        self.assertTrue(all(line.rsplit(b' ', 1)[1].isdigit() for line in body.splitlines()))
+
+        for query in ('seconds=0', 'seconds=-1', 'seconds=nan', 'interval=0', 'interval=-0.1', 'interval=x'):
+            status, _ = self.get_health(f'/debug/profile?{query}', port=5002)
+            self.assertEqual(status, 400, query)
+
 
 if __name__ == '__main__':
     unittest.main()
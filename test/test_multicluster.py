@@ -0,0 +1,205 @@
+"""
+Runs a StreamWatch against several fake apiservers, one of which is unreachable.
+"""
+import json
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from kubernetes import client
+
+from skafos.event_listener import EventListener
+from skafos.healthcheck import state
+from skafos.stream_watch import StreamWatch
+
+
+class FakeApiServer(BaseHTTPRequestHandler):
+    """
+    Serves a watch on namespaces: two namespaces when watching from the start, nothing afterwards.
+    """
+    def do_GET(self):
+        query = parse_qs(urlparse(self.path).query)
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.end_headers()
+
+        if query.get('resourceVersion', ['0']) == ['0']:
+            for index in range(2):
+                event = {
+                    'type': 'ADDED',
+                    'object': {
+                        'apiVersion': 'v1',
+                        'kind': 'Namespace',
+                        'metadata': {'name': f'ns-{index}', 'resourceVersion': str(10 + index)}
+                    }
+                }
+                self.wfile.write(json.dumps(event).encode('utf-8') + b'\n')
+        else:
+            time.sleep(0.2)
+
+    def log_message(self, fmt, *args):
+        return
+
+
+class IdleApiServer(BaseHTTPRequestHandler):
+    """
+    Accepts a watch, but never sends an event.
+    """
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.end_headers()
+        time.sleep(30)
+
+    def log_message(self, fmt, *args):
+        return
+
+
+def start_fake_apiserver(handler=FakeApiServer):
+    server = ThreadingHTTPServer(('localhost', 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def create_config(host):
+    config = client.Configuration()
+    config.host = host
+    return config
+
+
+class Recorder(EventListener):
+    lock = threading.Lock()
+    seen = []
+
+    def create(self):
+        with Recorder.lock:
+            Recorder.seen.append((self.cluster, self.metadata.name))
+
+
+class BlockingRecorder(EventListener):
+    release = threading.Event()
+    seen = []
+
+    def create(self):
+        if self.cluster == 'slow':
+            BlockingRecorder.release.wait(10)
+        BlockingRecorder.seen.append((self.cluster, self.metadata.name))
+
+
+class HostRecorder(EventListener):
+    def __init__(self):
+        super().__init__(None)
+        self.seen = []
+
+    def create(self):
+        self.seen.append((self.cluster, self.api_client.configuration.host))
+
+
+class TestMultiCluster(unittest.TestCase):
+    def test_clusters(self):
+        servers = [start_fake_apiserver() for _ in range(2)]
+        clusters = {
+            'a': create_config(f'http://localhost:{servers[0].server_port}'),
+            'b': create_config(f'http://localhost:{servers[1].server_port}'),
+            'unreachable': create_config('http://localhost:1'),
+        }
+        stream_watch = StreamWatch({'method': lambda x: x.list_namespace}, [Recorder], clusters=clusters)
+        threading.Thread(target=stream_watch.run, kwargs={'timeout': 1, 'healthcheck_port': 5004},
+                         daemon=True).start()
+
+        try:
+            deadline = time.time() + 10
+            while len(Recorder.seen) < 4:
+                assert time.time() < deadline
+                time.sleep(0.05)
+
+            assert sorted(Recorder.seen) == [('a', 'ns-0'), ('a', 'ns-1'), ('b', 'ns-0'), ('b', 'ns-1')]
+            assert stream_watch.clusters['a'].streams[0].resource_version == '11'
+            assert stream_watch.clusters['a'].connected
+            assert not stream_watch.clusters['unreachable'].connected
+
+            ready, statuses = stream_watch.check_clusters()
+            assert ready
+            assert 'unreachable/all: not connected' in statuses
+        finally:
+            stream_watch.stop()
+            for server in servers:
+                server.shutdown()
+
+    def test_idle_cluster(self):
+        server = start_fake_apiserver(IdleApiServer)
+        config = create_config(f'http://localhost:{server.server_port}')
+        stream_watch = StreamWatch({'method': lambda x: x.list_namespace}, [Recorder], config)
+        state.last_beat = 0
+        threading.Thread(target=stream_watch.run, kwargs={'timeout': 3600, 'healthcheck_port': 5006},
+                         daemon=True).start()
+
+        try:
+            # Connected and alive without any event, long before the watch times out
+            deadline = time.time() + 5
+            while not stream_watch.get_cluster().connected:
+                assert time.time() < deadline
+                time.sleep(0.05)
+
+            assert stream_watch.check_clusters()[0]
+            assert state.live()[0]
+        finally:
+            stream_watch.stop()
+            server.shutdown()
+
+    def test_slow_cluster(self):
+        servers = [start_fake_apiserver() for _ in range(2)]
+        clusters = {
+            'slow': create_config(f'http://localhost:{servers[0].server_port}'),
+            'fast': create_config(f'http://localhost:{servers[1].server_port}'),
+        }
+        stream_watch = StreamWatch({'method': lambda x: x.list_namespace}, [BlockingRecorder], clusters=clusters)
+        threading.Thread(target=stream_watch.run, kwargs={'timeout': 1, 'healthcheck_port': 5007, 'n_threads': 2},
+                         daemon=True).start()
+
+        try:
+            # The listener blocks on both objects of the slow cluster, but may only occupy one of the two workers
+            deadline = time.time() + 10
+            while len(BlockingRecorder.seen) < 2:
+                assert time.time() < deadline
+                time.sleep(0.05)
+            assert sorted(BlockingRecorder.seen) == [('fast', 'ns-0'), ('fast', 'ns-1')]
+
+            BlockingRecorder.release.set()
+            while len(BlockingRecorder.seen) < 4:
+                assert time.time() < deadline
+                time.sleep(0.05)
+        finally:
+            BlockingRecorder.release.set()
+            stream_watch.stop()
+            for server in servers:
+                server.shutdown()
+
+    def test_listener_instance(self):
+        servers = [start_fake_apiserver() for _ in range(2)]
+        clusters = {name: create_config(f'http://localhost:{server.server_port}')
+                    for name, server in zip('ab', servers)}
+        listener = HostRecorder()
+        stream_watch = StreamWatch({'method': lambda x: x.list_namespace}, [listener], clusters=clusters)
+        threading.Thread(target=stream_watch.run, kwargs={'timeout': 1, 'healthcheck_port': 5008},
+                         daemon=True).start()
+
+        try:
+            deadline = time.time() + 10
+            while len(listener.seen) < 4:
+                assert time.time() < deadline
+                time.sleep(0.05)
+
+            # Writes of the shared instance go to the cluster of the event
+            assert set(listener.seen) == {(name, config.host) for name, config in clusters.items()}
+        finally:
+            stream_watch.stop()
+            for server in servers:
+                server.shutdown()
+
+
+if __name__ == '__main__':
+    unittest.main()
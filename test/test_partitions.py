@@ -0,0 +1,135 @@
+import json
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from kubernetes import client
+
+from skafos.cluster import Stream
+from skafos.event_listener import EventListener
+from skafos.stream_watch import StreamWatch
+
+
+class FakeApiServer(BaseHTTPRequestHandler):
+    """
+    Serves a watch on config maps of a namespace, with one config map per namespace.
+    """
+    requests = []
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        FakeApiServer.requests.append((url.path, query.get('labelSelector', [None])[0]))
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.end_headers()
+        if query.get('resourceVersion', ['0']) == ['0']:
+            namespace = url.path.split('/')[4]
+            event = {
+                'type': 'ADDED',
+                'object': {
+                    'apiVersion': 'v1',
+                    'kind': 'ConfigMap',
+                    'metadata': {'name': 'config', 'namespace': namespace, 'resourceVersion': '1'}
+                }
+            }
+            self.wfile.write(json.dumps(event).encode('utf-8') + b'\n')
+        else:
+            time.sleep(0.2)
+
+    def log_message(self, fmt, *args):
+        return
+
+
+class Recorder(EventListener):
+    seen = []
+
+    def create(self):
+        Recorder.seen.append(self.metadata.namespace)
+
+
+class TestPartitions(unittest.TestCase):
+    def test_partitions(self):
+        stream_watch = StreamWatch({'method': lambda x: x.list_namespaced_pod, 'label_selector': 'app=web',
+                                    'namespaces': ['a', 'b'], 'label_shards': ['shard=0', 'shard=1']}, [])
+        assert stream_watch.get_partitions() == [
+            ('namespace=a,shard=0', {'namespace': 'a', 'label_selector': 'app=web,shard=0'}),
+            ('namespace=a,shard=1', {'namespace': 'a', 'label_selector': 'app=web,shard=1'}),
+            ('namespace=b,shard=0', {'namespace': 'b', 'label_selector': 'app=web,shard=0'}),
+            ('namespace=b,shard=1', {'namespace': 'b', 'label_selector': 'app=web,shard=1'}),
+        ]
+
+        stream_watch = StreamWatch({'method': lambda x: x.list_namespace, 'field_selector': 'metadata.name=x'}, [])
+        assert stream_watch.get_partitions() == [('all', {})]
+        _, _, kwargs, _ = stream_watch.get_stream_config()
+        assert kwargs == {'field_selector': 'metadata.name=x'}
+
+    def test_namespaces(self):
+        server = ThreadingHTTPServer(('localhost', 0), FakeApiServer)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+        config = client.Configuration()
+        config.host = f'http://localhost:{server.server_port}'
+        target = {'method': lambda x: x.list_namespaced_config_map, 'label_selector': 'app=web',
+                  'namespaces': ['team-a', 'team-b']}
+        stream_watch = StreamWatch(target, [Recorder], config)
+        threading.Thread(target=stream_watch.run, kwargs={'timeout': 1, 'healthcheck_port': 5005},
+                         daemon=True).start()
+
+        try:
+            deadline = time.time() + 10
+            while len(Recorder.seen) < 2:
+                assert time.time() < deadline
+                time.sleep(0.05)
+
+            assert sorted(Recorder.seen) == ['team-a', 'team-b']
+            assert ('/api/v1/namespaces/team-a/configmaps', 'app=web') in FakeApiServer.requests
+            assert [stream.name for stream in stream_watch.clusters['default'].streams] == \
+                ['namespace=team-a', 'namespace=team-b']
+        finally:
+            stream_watch.stop()
+            server.shutdown()
+
+    def test_shard_move(self):
+        class Pool:
+            def __init__(self):
+                self.jobs = []
+
+            def put(self, key, job):
+                self.jobs.append((job[1].type, job[1].resource_version, job[0].name))
+
+        def event(ev_type, resource_version):
+            return {'type': ev_type, 'object': {'metadata': {'name': 'web', 'namespace': 'default',
+                                                              'resourceVersion': resource_version}}}
+
+        stream_watch = StreamWatch({'method': lambda x: x.list_namespaced_pod,
+                                    'label_shards': ['shard=0', 'shard=1']}, [])
+        cluster = stream_watch.get_cluster()
+        old_shard, new_shard = Stream(cluster, 'shard=0'), Stream(cluster, 'shard=1')
+        pool = Pool()
+
+        stream_watch.enqueue(old_shard, pool, event('ADDED', '5'))
+        # The object moves to the other shard in version 7, the new shard is faster than the old one
+        stream_watch.enqueue(new_shard, pool, event('ADDED', '7'))
+        stream_watch.enqueue(old_shard, pool, event('MODIFIED', '6'))
+        stream_watch.enqueue(old_shard, pool, event('DELETED', '7'))
+        stream_watch.enqueue(new_shard, pool, event('MODIFIED', '8'))
+
+        assert pool.jobs == [('ADDED', '5', 'shard=0'), ('ADDED', '7', 'shard=1'), ('MODIFIED', '8', 'shard=1')]
+
+        # A delete in the shard that has the object is handled
+        stream_watch.enqueue(new_shard, pool, event('DELETED', '9'))
+        assert pool.jobs[-1] == ('DELETED', '9', 'shard=1')
+
+        # Without shards an object is only in one stream, so versions aren't kept
+        stream_watch = StreamWatch({'method': lambda x: x.list_namespaced_pod, 'namespaces': ['a', 'b']}, [])
+        stream_watch.enqueue(Stream(stream_watch.get_cluster(), 'namespace=a'), pool, event('ADDED', '10'))
+        assert stream_watch.versions == {}
+
+
+if __name__ == '__main__':
+    unittest.main()
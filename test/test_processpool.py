@@ -0,0 +1,158 @@
+import os
+import tempfile
+import unittest
+
+from skafos.compact import CompactEvent
+from skafos.event_listener import EventListener
+from skafos.processpool import ProcessPool, RemoteListener
+from skafos.resync import object_digest
+from skafos.stream_watch import StreamWatch
+
+
+def fake_event(name, **spec):
+    return {
+        'type': 'ADDED',
+        'object': {
+            'metadata': {'name': name, 'namespace': 'default'},
+            'spec': spec
+        }
+    }
+
+
+class PidListener(EventListener):
+    run_in_process = True
+
+    def create(self):
+        self.ev_state.setdefault('pids', []).append(os.getpid())
+        return not self.event_obj['spec'].get('fail')
+
+    def rollback(self):
+        with open(self.event_obj['spec']['rollback_marker'], 'w') as marker:
+            marker.write(str(os.getpid()))
+
+
+class CrashOnceListener(EventListener):
+    run_in_process = True
+
+    def create(self):
+        marker = self.event_obj['spec']['crash_marker']
+        if not os.path.exists(marker):
+            open(marker, 'w').close()
+            os._exit(1)
+        self.ev_state['pid'] = os.getpid()
+
+
+class AlwaysResyncListener(EventListener):
+    run_in_process = True
+
+    def update(self):
+        open(self.event_obj['spec']['resync_marker'], 'w').close()
+
+    def digest(self):
+        return f'pid-{os.getpid()}'
+
+    def needs_resync(self, last_digest):
+        return True
+
+
+class LocalListener(EventListener):
+    rolled_back = []
+
+    def create(self):
+        self.ev_state['local'] = os.getpid()
+
+    def rollback(self):
+        LocalListener.rolled_back.append(self.metadata['name'])
+
+
+class TestProcessPool(unittest.TestCase):
+    def setUp(self):
+        self.pool = ProcessPool(2)
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.pool.stop()
+        self.tmp.cleanup()
+
+    def process(self, listener_cls, event):
+        ev_state = {}
+        listener = RemoteListener(self.pool, listener_cls, event)
+        process_ok = listener.process(event, ev_state)
+        listener.release()
+        return process_ok, ev_state
+
+    def test_affinity(self):
+        pids = {}
+        for _ in range(3):
+            for name in ('a', 'b', 'c', 'd'):
+                process_ok, ev_state = self.process(PidListener, fake_event(name))
+                assert process_ok
+                assert ev_state['pids'][0] != os.getpid()
+                pids.setdefault(name, set()).update(ev_state['pids'])
+
+        assert all(len(x) == 1 for x in pids.values())
+
+    def test_crash(self):
+        event = fake_event('crash', crash_marker=os.path.join(self.tmp.name, 'crashed'))
+        process_ok, ev_state = self.process(CrashOnceListener, event)
+        assert process_ok
+        assert 'pid' in ev_state
+
+    def test_lost_rollback(self):
+        marker = os.path.join(self.tmp.name, 'rolled_back')
+        event = fake_event('lost', rollback_marker=marker, crash_marker=os.path.join(self.tmp.name, 'crashed'))
+        listener = RemoteListener(self.pool, PidListener, event)
+        assert listener.process(event, {})
+
+        # The process of the key crashes while it still holds the first listener
+        assert self.process(CrashOnceListener, event)[0]
+        assert not listener.rollback()
+        assert not os.path.exists(marker)
+        listener.release()
+        assert listener.token not in self.pool.lost
+
+    def test_resync_overrides(self):
+        marker = os.path.join(self.tmp.name, 'resynced')
+        raw_object = fake_event('resync', resync_marker=marker)['object']
+        stream_watch = StreamWatch({'method': lambda x: x.list_namespace}, [AlwaysResyncListener])
+        stream_watch.process_pool = self.pool
+
+        # The object did not change, but the listener overrides needs_resync in its process
+        event = CompactEvent('MODIFIED', raw_object, cluster='default')
+        event.resync = True
+        stream_watch.digests.set('AlwaysResyncListener', ('default', 'default', 'resync'), object_digest(raw_object))
+        stream_watch.reconcile(event)
+        assert os.path.exists(marker)
+
+        listener = RemoteListener(self.pool, AlwaysResyncListener, event)
+        assert listener.process(event, {})
+        digest = listener.digest()
+        listener.release()
+        assert digest.startswith('pid-') and digest != f'pid-{os.getpid()}'
+
+    def test_skipped_resync(self):
+        raw_object = fake_event('skipped')['object']
+        stream_watch = StreamWatch({'method': lambda x: x.list_namespace}, [PidListener])
+        stream_watch.process_pool = self.pool
+        stream_watch.digests.set('PidListener', ('default', 'default', 'skipped'), object_digest(raw_object))
+
+        # The object didn't change, so every resync is skipped; the listeners in the process are released anyway
+        for _ in range(3):
+            event = CompactEvent('MODIFIED', raw_object, cluster='default')
+            event.resync = True
+            stream_watch.reconcile(event)
+        assert self.pool.held == [set(), set()]
+
+    def test_reconcile_rollback(self):
+        marker = os.path.join(self.tmp.name, 'rolled_back')
+        stream_watch = StreamWatch({'method': lambda x: x.list_namespace}, [LocalListener, PidListener])
+        stream_watch.process_pool = self.pool
+
+        stream_watch.reconcile(fake_event('rollback', fail=True, rollback_marker=marker))
+        assert LocalListener.rolled_back == ['rollback']
+        with open(marker) as data:
+            assert int(data.read()) != os.getpid()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+import unittest
+from unittest.mock import patch
+
+from kubernetes.client.rest import ApiException
+
+from skafos.api_client import ListenerApiClient
+from skafos.metrics import METRICS
+from skafos.ratelimit import TokenBucket
+
+
+class FakeResponse:
+    def __init__(self, status, headers=None):
+        self.status = status
+        self.reason = 'Too Many Requests'
+        self.data = b''
+        self.headers = headers or {}
+
+    def getheaders(self):
+        return self.headers
+
+
+class TestRateLimit(unittest.TestCase):
+    def test_burst(self):
+        bucket = TokenBucket(qps=10, burst=3)
+        assert [bucket.reserve() for _ in range(3)] == [0, 0, 0]
+
+        # Fourth request has to wait for a new token
+        self.assertAlmostEqual(bucket.reserve(), 0.1, places=2)
+
+    def test_throttled(self):
+        bucket = TokenBucket(qps=10, burst=3)
+        bucket.throttled(2)
+        assert bucket.qps == 5
+        self.assertAlmostEqual(bucket.reserve(), 2, places=1)
+
+        for _ in range(100):
+            bucket.succeeded()
+        assert bucket.qps == 10
+
+    @patch('kubernetes.client.api_client.ApiClient.request')
+    def test_retry_after(self, request):
+        request.side_effect = [ApiException(http_resp=FakeResponse(429, {'Retry-After': '0'})), 'ok']
+        api_client = ListenerApiClient(rate_limiter=TokenBucket(qps=100))
+        before = METRICS.get('skafos_api_throttled_responses_total')
+
+        assert api_client.request('GET', 'http://localhost/api') == 'ok'
+        assert request.call_count == 2
+        assert METRICS.get('skafos_api_throttled_responses_total') == before + 1
+
+    @patch('kubernetes.client.api_client.ApiClient.request')
+    def test_max_retries(self, request):
+        request.side_effect = ApiException(http_resp=FakeResponse(429, {'Retry-After': '0'}))
+        api_client = ListenerApiClient(rate_limiter=TokenBucket(qps=100), max_retries=2)
+
+        with self.assertRaises(ApiException):
+            api_client.request('GET', 'http://localhost/api')
+        assert request.call_count == 3
+
+
+if __name__ == '__main__':
+    unittest.main()
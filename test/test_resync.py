@@ -0,0 +1,205 @@
+import json
+import threading
+import time
+import unittest
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from kubernetes import client
+
+from skafos import resync
+from skafos.cluster import Stream
+from skafos.compact import CompactEvent
+from skafos.event_listener import EventListener
+from skafos.resync import Resyncer, object_digest
+from skafos.stream_watch import StreamWatch
+
+
+def fake_object(image='nginx', status='Running', resource_version='1'):
+    return {
+        'metadata': {'name': 'obj', 'namespace': 'default', 'resourceVersion': resource_version},
+        'spec': {'image': image},
+        'status': {'phase': status}
+    }
+
+
+def resync_event(raw_object):
+    event = CompactEvent('MODIFIED', raw_object)
+    event.resync = True
+    return event
+
+
+class CountingListener(EventListener):
+    calls = 0
+    succeed = True
+
+    def create(self):
+        CountingListener.calls += 1
+
+    def update(self):
+        CountingListener.calls += 1
+        return CountingListener.succeed
+
+
+class TestResync(unittest.TestCase):
+    def test_digest(self):
+        assert object_digest(fake_object()) == object_digest(fake_object(status='Pending', resource_version='2'))
+        assert object_digest(fake_object()) != object_digest(fake_object(image='httpd'))
+
+    def test_spread(self):
+        emitted = []
+        done = threading.Event()
+
+        def emit(key, source, event):
+            emitted.append((time.monotonic(), key))
+            if len(emitted) == 20:
+                done.set()
+
+        resyncer = Resyncer(emit, period=0.5)
+        for index in range(20):
+            resyncer.observe(('default', 'ns', str(index)), None, {'type': 'ADDED'})
+        resyncer.observe(('default', 'ns', '0'), None, {'type': 'DELETED'})
+        resyncer.observe(('default', 'ns', '20'), None, {'type': 'ADDED'})
+
+        started = time.monotonic()
+        resyncer.start()
+        assert done.wait(2)
+        resyncer.stop()
+
+        keys = [key for _, key in emitted]
+        assert ('default', 'ns', '0') not in keys
+        assert len(set(keys)) == 20
+        assert keys == sorted(keys, key=resyncer.offset)
+        # Emitted at their offset within the period instead of all at once
+        for emitted_at, key in emitted:
+            self.assertAlmostEqual(emitted_at - started, resyncer.offset(key), delta=0.1)
+
+    def test_reconcile(self):
+        stream_watch = StreamWatch({'method': lambda x: x.list_namespace}, [CountingListener])
+        stream_watch.resyncer = Resyncer(lambda *args: None, period=60)
+
+        stream_watch.reconcile(CompactEvent('ADDED', fake_object()))
+        assert CountingListener.calls == 1
+
+        # Nothing changed (except status): the resync is skipped
+        stream_watch.reconcile(resync_event(fake_object(status='Pending')))
+        assert CountingListener.calls == 1
+
+        # The object drifted, the listener runs and fails
+        CountingListener.succeed = False
+        stream_watch.reconcile(resync_event(fake_object(image='httpd')))
+        assert CountingListener.calls == 2
+
+        # After a failure the digest is forgotten, so the next resync runs the listener again
+        CountingListener.succeed = True
+        stream_watch.reconcile(resync_event(fake_object(image='httpd')))
+        stream_watch.reconcile(resync_event(fake_object(image='httpd')))
+        assert CountingListener.calls == 3
+
+    def test_digest_once(self):
+        stream_watch = StreamWatch({'method': lambda x: x.list_namespace}, [])
+
+        class NameListener(EventListener):
+            def digest(self):
+                assert not stream_watch.lock.locked()
+                return self.metadata['name']
+
+        class A(EventListener):
+            pass
+
+        class B(EventListener):
+            pass
+
+        stream_watch.listeners = [A, B, NameListener]
+        stream_watch.resyncer = Resyncer(lambda *args: None, period=60)
+        with patch('skafos.stream_watch.object_digest', wraps=resync.object_digest) as digest:
+            stream_watch.reconcile(CompactEvent('ADDED', fake_object()))
+            assert digest.call_count == 1
+
+        key = ('default', 'default', 'obj')
+        assert stream_watch.digests.get('A', key) == stream_watch.digests.get('B', key) == object_digest(fake_object())
+        assert stream_watch.digests.get('NameListener', key) == 'obj'
+
+    def test_observed_memory(self):
+        class Pool:
+            def put(self, key, job):
+                self.event = job[1]
+
+        stream_watch = StreamWatch({'method': lambda x: x.list_namespace}, [])
+        stream_watch.resyncer = Resyncer(lambda *args: None, period=60)
+        raw_object = {'apiVersion': 'v1', 'kind': 'Namespace',
+                      'metadata': {'name': 'obj', 'resourceVersion': '1'}}
+        pool = Pool()
+        stream_watch.enqueue(Stream(stream_watch.get_cluster(), 'all'), pool,
+                             {'type': 'ADDED', 'object': client.V1Namespace(), 'raw_object': raw_object})
+
+        # Reconciling deserializes the model of the queued event, but not of the event kept for resyncs
+        assert isinstance(pool.event['object'], client.V1Namespace)
+        _, observed = stream_watch.resyncer.objects[('default', None, 'obj')]
+        assert observed._object is None
+        assert observed.raw_object is pool.event.raw_object
+
+    def test_deleted_during_resync(self):
+        class Pool:
+            def __init__(self):
+                self.jobs = []
+
+            def put(self, key, job):
+                self.jobs.append(job)
+
+        class UpdateListener(EventListener):
+            updates = 0
+
+            def update(self):
+                UpdateListener.updates += 1
+
+        stream_watch = StreamWatch({'method': lambda x: x.list_namespace}, [UpdateListener])
+        stream_watch.resyncer = Resyncer(lambda *args: None, period=60)
+        stream, pool = Stream(stream_watch.get_cluster(), 'all'), Pool()
+        key = ('default', 'default', 'obj')
+
+        stream_watch.enqueue(stream, pool, {'type': 'ADDED', 'object': fake_object()})
+        stream_watch.handle(pool.jobs.pop())
+
+        # A resync is queued, and the object is deleted before the resync is handled
+        stream_watch.enqueue_resync(key, stream, pool, stream_watch.resyncer.objects[key][1])
+        stream_watch.enqueue(stream, pool, {'type': 'DELETED', 'object': fake_object(resource_version='2')})
+        resync_job, delete_job = pool.jobs
+        stream_watch.handle(delete_job)
+        stream_watch.handle(resync_job)
+        assert UpdateListener.updates == 0
+        assert stream.pending == 0
+
+    def test_relist(self):
+        class Pool:
+            def __init__(self):
+                self.jobs = []
+
+            def put(self, key, job):
+                self.jobs.append(job)
+
+        def list_namespaced_pod(*args, **kwargs):
+            assert kwargs == {'namespace': 'default', '_preload_content': False}
+            items = [{'metadata': {'name': 'kept', 'namespace': 'default', 'resourceVersion': '5'}}]
+            return SimpleNamespace(data=json.dumps({'apiVersion': 'v1', 'kind': 'PodList', 'items': items,
+                                                    'metadata': {'resourceVersion': '9'}}))
+
+        stream_watch = StreamWatch({'method': lambda x: x.list_namespaced_pod}, [])
+        stream_watch.resyncer = Resyncer(lambda *args: None, period=60)
+        stream, pool = Stream(stream_watch.get_cluster(), 'all'), Pool()
+        for name in ('kept', 'gone'):
+            raw_object = {'metadata': {'name': name, 'namespace': 'default', 'resourceVersion': '1'}}
+            stream_watch.enqueue(stream, pool, {'type': 'ADDED', 'object': raw_object})
+        pool.jobs = []
+
+        # The watch expired, and 'gone' was deleted in the meantime
+        stream.expired = True
+        stream_watch.relist(stream, pool, list_namespaced_pod, [], {'namespace': 'default'})
+        assert [(event.type, event.name) for _, event in pool.jobs] == [('ADDED', 'kept'), ('DELETED', 'gone')]
+        assert pool.jobs[0][1].raw_object['kind'] == 'Pod'
+        assert list(stream_watch.resyncer.objects) == [('default', 'default', 'kept')]
+        assert (stream.resource_version, stream.expired) == ('9', False)
+
+
+if __name__ == '__main__':
+    unittest.main()
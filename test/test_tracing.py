@@ -0,0 +1,90 @@
+import json
+import os
+import tempfile
+import time
+import unittest
+
+from skafos.compact import CompactEvent
+from skafos.event_listener import EventListener
+from skafos.stream_watch import StreamWatch
+from skafos.tracing import NOOP_SPAN, TRACER, MemorySink, OTLPFileSink
+
+
+class FailingListener(EventListener):
+    def update(self):
+        return False
+
+
+class TestTracing(unittest.TestCase):
+    def setUp(self):
+        self.sink = MemorySink()
+        TRACER.set_sink(self.sink)
+
+    def tearDown(self):
+        TRACER.set_sink(None)
+
+    def test_disabled(self):
+        TRACER.set_sink(None)
+        assert TRACER.span('anything') is NOOP_SPAN
+
+    def test_nesting(self):
+        with TRACER.span('outer') as outer:
+            with TRACER.span('inner', answer=42):
+                pass
+
+        inner, exported_outer = self.sink.spans
+        assert exported_outer is outer
+        assert inner.trace_id == outer.trace_id
+        assert inner.parent_id == outer.span_id
+        assert inner.attributes == {'answer': 42}
+        assert outer.start <= inner.start <= inner.end <= outer.end
+
+    def test_reconcile(self):
+        event = CompactEvent('MODIFIED', {'metadata': {'name': 'obj', 'namespace': 'default'}})
+        event.trace = (1, 2, time.time_ns())
+        stream_watch = StreamWatch({'method': lambda x: x.list_namespace}, [FailingListener])
+        stream_watch.reconcile(event)
+
+        spans = {span.name: span for span in self.sink.spans}
+        assert set(spans) == {'event.queue', 'reconcile', 'listener.update', 'listener.rollback'}
+        assert all(span.trace_id == 1 for span in spans.values())
+        assert spans['reconcile'].parent_id == 2
+        assert spans['listener.update'].parent_id == spans['reconcile'].span_id
+        assert spans['listener.update'].attributes == {'listener': 'FailingListener', 'ok': False}
+
+    def test_otlp_file(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'spans.jsonl')
+            sink = OTLPFileSink(path, batch_size=2)
+            TRACER.set_sink(sink)
+            for _ in range(3):
+                with TRACER.span('span', key='default/obj'):
+                    pass
+            sink.flush()
+
+            with open(path) as data:
+                requests = [json.loads(line) for line in data]
+
+        assert len(requests) == 2
+        spans = requests[0]['resourceSpans'][0]['scopeSpans'][0]['spans']
+        assert len(spans) == 2
+        assert len(spans[0]['traceId']) == 32
+        assert spans[0]['attributes'] == [{'key': 'key', 'value': {'stringValue': 'default/obj'}}]
+
+    def test_otlp_flush_interval(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'spans.jsonl')
+            sink = OTLPFileSink(path, flush_interval=0.1)
+            TRACER.set_sink(sink)
+            with TRACER.span('span'):
+                pass
+            TRACER.set_sink(None)
+
+            # A single span doesn't fill the batch, but is written after the flush interval
+            time.sleep(0.3)
+            with open(path) as data:
+                assert len(data.readlines()) == 1
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,43 @@
+import threading
+import unittest
+
+from skafos.watchdog import Watchdog
+
+
+class TestWatchdog(unittest.TestCase):
+    def test_stuck(self):
+        watchdog = Watchdog(stuck_timeout=0)
+        started, release = threading.Event(), threading.Event()
+
+        def worker():
+            watchdog.begin('SlowListener', ('default', 'obj'))
+            started.set()
+            release.wait()
+            watchdog.end()
+
+        thread = threading.Thread(target=worker, name='worker-1')
+        thread.start()
+        started.wait()
+
+        watchdog.scan()
+        check_ok, message = watchdog.check()
+        assert not check_ok
+        assert message.startswith("worker-1 is stuck in SlowListener for ('default', 'obj')")
+
+        release.set()
+        thread.join()
+        watchdog.scan()
+        assert watchdog.check() == (True, 'Ok')
+        assert watchdog.heartbeats == []  # The thread stopped, so it is forgotten
+
+    def test_progress(self):
+        watchdog = Watchdog(stuck_timeout=60)
+        watchdog.begin('FastListener', 'key')
+        watchdog.scan()
+        assert watchdog.check() == (True, 'Ok')
+        watchdog.end()
+        assert watchdog.heartbeat().started is None
+
+
+if __name__ == '__main__':
+    unittest.main()
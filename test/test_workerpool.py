@@ -0,0 +1,89 @@
+import threading
+import time
+import unittest
+
+from skafos.metrics import METRICS
+from skafos.workerpool import WorkerPool
+
+
+class TestWorkerPool(unittest.TestCase):
+    def test_ordering(self):
+        handled = {}
+        lock = threading.Lock()
+
+        def handler(job):
+            key, index = job
+            time.sleep(0.001)
+            with lock:
+                handled.setdefault(key, []).append(index)
+
+        pool = WorkerPool(handler, min_workers=2, max_workers=8, name='test-ordering')
+        pool.start()
+        for index in range(20):
+            for key in 'abcd':
+                pool.put(key, (key, index))
+
+        deadline = time.time() + 5
+        while pool.qsize() or sum(len(x) for x in handled.values()) < 80:
+            assert time.time() < deadline
+            time.sleep(0.01)
+        for key in 'abcd':
+            assert handled[key] == list(range(20))
+
+    def test_scaling(self):
+        release = threading.Event()
+        pool = WorkerPool(lambda job: release.wait(), min_workers=1, max_workers=4, idle_timeout=0.1,
+                          name='test-scaling')
+        pool.start()
+
+        # Blocking jobs for different keys make the pool grow up to max_workers
+        for key in range(6):
+            pool.put(key, key)
+        time.sleep(0.1)
+        assert pool.workers == 4
+        assert METRICS.get('skafos_pool_workers', pool='test-scaling') == 4
+
+        # After the work is done and workers are idle, the pool shrinks back to min_workers
+        release.set()
+        deadline = time.time() + 5
+        while pool.workers > 1:
+            assert time.time() < deadline
+            time.sleep(0.05)
+        assert pool.qsize() == 0
+        assert METRICS.get('skafos_pool_scale_down_total', pool='test-scaling') == 3
+
+    def test_groups(self):
+        release = threading.Event()
+        handled = []
+
+        def handler(job):
+            group, index = job
+            if group == 'slow':
+                release.wait(5)
+            handled.append(job)
+
+        pool = WorkerPool(handler, min_workers=2, max_workers=2, name='test-groups', group=lambda key: key[0],
+                          max_group_workers=1)
+        pool.start()
+
+        # The slow group is queued first, but it can only block one of the two workers
+        for index in range(3):
+            pool.put(('slow', index), ('slow', index))
+        for index in range(3):
+            pool.put(('fast', index), ('fast', index))
+
+        deadline = time.time() + 5
+        while len(handled) < 3:
+            assert time.time() < deadline
+            time.sleep(0.01)
+        assert handled == [('fast', 0), ('fast', 1), ('fast', 2)]
+
+        release.set()
+        while len(handled) < 6:
+            assert time.time() < deadline
+            time.sleep(0.01)
+        assert pool.busy['slow'] == 0
+
+
+if __name__ == '__main__':
+    unittest.main()